@@ -3,6 +3,11 @@ import pandas as pd
 from pathlib import Path
 from collections import Counter
 
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
 # -----------------------------------------------------------------------------
 # Paths
 # -----------------------------------------------------------------------------
@@ -20,6 +25,9 @@ STATE_FILES = [
 OUT_JSON = BASE_DIR / "traffic_laws_dataset.json"
 OUT_CSV = BASE_DIR / "traffic_laws_dataset.csv"
 
+# Low-cardinality columns stored as pandas categoricals
+CATEGORICAL_COLUMNS = ("jurisdiction", "category", "severity")
+
 # -----------------------------------------------------------------------------
 # Helpers
 # -----------------------------------------------------------------------------
@@ -48,6 +56,16 @@ def validate_record(record: dict, source: str):
             f"'keywords' must be a list in record id={record.get('id')} from {source}"
         )
 
+def write_json(records: list, fp: Path):
+    # For this dataset's str/int/list records, orjson's OPT_INDENT_2 output matches
+    # json.dump(indent=2, ensure_ascii=False); not in general (floats like 1e16, ints over 64 bits)
+    if orjson is not None:
+        with open(fp, "wb") as f:
+            f.write(orjson.dumps(records, option=orjson.OPT_INDENT_2))
+    else:
+        with open(fp, "w", encoding="utf-8") as f:
+            json.dump(records, f, indent=2, ensure_ascii=False)
+
 def load_state_file(fp: Path):
     with open(fp, "r", encoding="utf-8") as f:
         data = json.load(f)
@@ -63,7 +81,7 @@ def load_state_file(fp: Path):
 # -----------------------------------------------------------------------------
 # Main build
 # -----------------------------------------------------------------------------
-def main():
+def load_dataset():
     if not STATES_DIR.exists():
         raise FileNotFoundError(f"States folder not found at: {STATES_DIR}")
 
@@ -87,12 +105,24 @@ def main():
             "Please ensure IDs are unique per record."
         )
 
-    df = pd.DataFrame(traffic_laws_data)
+    return traffic_laws_data
+
+def build_dataset(traffic_laws_data: list, out_dir: Path = BASE_DIR) -> pd.DataFrame:
+    out_dir = Path(out_dir)
 
-    df.to_csv(OUT_CSV, index=False)
+    df = pd.DataFrame.from_records(traffic_laws_data)
+    for col in CATEGORICAL_COLUMNS:
+        df[col] = df[col].astype("category")
 
-    with open(OUT_JSON, "w", encoding="utf-8") as f:
-        json.dump(traffic_laws_data, f, indent=2, ensure_ascii=False)
+    df.to_csv(out_dir / OUT_CSV.name, index=False)
+
+    write_json(traffic_laws_data, out_dir / OUT_JSON.name)
+
+    return df
+
+def main():
+    traffic_laws_data = load_dataset()
+    df = build_dataset(traffic_laws_data)
 
     print("Dataset created successfully!")
     print(f"JSON saved to: {OUT_JSON}")
@@ -107,4 +137,4 @@ def main():
     print(json.dumps(traffic_laws_data[0], indent=2))
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
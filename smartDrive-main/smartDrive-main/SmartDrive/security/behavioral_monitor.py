@@ -4,17 +4,26 @@ Tracks user behavior patterns to detect coordinated attacks
 File: security/behavioral_monitor.py
 """
 
+import heapq
+import time
 from datetime import datetime, timedelta
+from itertools import islice
 from typing import Dict, List
-from collections import defaultdict
+from collections import Counter, OrderedDict, deque
 
 
 class BehavioralMonitor:
     """Monitors user behavior patterns to detect systematic attacks"""
     
-    def __init__(self, session_timeout_minutes: int = 30):
-        self.user_sessions = {}
+    _HIGH_SEVERITY = frozenset({"SYSTEMATIC_PROBING", "ESCALATING_ATTACKS", "FUZZING_ATTACK"})
+    
+    def __init__(self, session_timeout_minutes: int = 30, max_sessions: int = 100_000):
+        # Kept in least-recently-active order; the coldest session is evicted at capacity
+        self.user_sessions = OrderedDict()
+        self.max_sessions = max_sessions
         self.session_timeout = timedelta(minutes=session_timeout_minutes)
+        # Min-heap of (earliest possible expiry, session_id); re-checked lazily on pop
+        self._expiry_heap = []
         
         # Thresholds for detection
         self.RAPID_QUERY_THRESHOLD = 10
@@ -22,6 +31,10 @@ class BehavioralMonitor:
         self.HIGH_ATTACK_RATIO = 0.4
         self.MIN_QUERIES_FOR_ANALYSIS = 5
         self.SYSTEMATIC_PROBING_THRESHOLD = 3
+        
+        # Sliding windows bounding per-session history
+        self.QUERY_HISTORY_WINDOW = 200
+        self.ATTACK_HISTORY_WINDOW = 500
     
     def analyze_session(self, session_id: str, query: str, validation_result: Dict) -> Dict:
         """
@@ -34,26 +47,41 @@ class BehavioralMonitor:
                 - action: str (CONTINUE, WARNING, RATE_LIMIT, BLOCK)
                 - details: dict with session statistics
         """
-        self._cleanup_expired_sessions()
-        
-        if session_id not in self.user_sessions:
-            self.user_sessions[session_id] = self._create_new_session()
+        now = datetime.now()
+        now_ts = time.monotonic()
+        self._cleanup_expired_sessions(now)
         
-        session = self.user_sessions[session_id]
-        session["last_activity"] = datetime.now()
+        session = self.user_sessions.get(session_id)
+        if session is not None:
+            self.user_sessions.move_to_end(session_id)
+        else:
+            if len(self.user_sessions) >= self.max_sessions:
+                self.user_sessions.popitem(last=False)
+            session = self._create_new_session(now, now_ts)
+            self.user_sessions[session_id] = session
+            heapq.heappush(self._expiry_heap, (now + self.session_timeout, session_id))
+            # Entries of LRU-evicted or re-created sessions linger in the heap; compact it
+            # so it stays O(max_sessions) even when session IDs are rotated
+            if len(self._expiry_heap) > 2 * len(self.user_sessions):
+                self._rebuild_expiry_heap()
+        
+        session["last_activity"] = now
         session["query_count"] += 1
-        session["queries"].append({
-            "query": query[:100],
-            "timestamp": datetime.now(),
-            "was_flagged": not validation_result.get("is_safe", True),
-            "flags": validation_result.get("flags", [])
-        })
-        
-        if not validation_result.get("is_safe", True):
+        was_flagged = not validation_result.get("is_safe", True)
+        session["query_flags"].append(int(was_flagged))
+        if len(session["opening_flags"]) < 3:
+            session["opening_flags"].append(int(was_flagged))
+        session["query_times"].append(now)
+        session["query_texts"].append(query[:100])
+        
+        if was_flagged:
+            flags = validation_result.get("flags", [])
             session["flagged_queries"] += 1
-            session["attack_patterns"].extend(validation_result.get("flags", []))
+            session["attack_patterns"].extend(flags)
+            session["attack_type_counts"].update(flag[0] for flag in flags)
         
-        risk_indicators = self._detect_risk_patterns(session)
+        unique_attack_types = len(session["attack_type_counts"])
+        risk_indicators = self._detect_risk_patterns(session, now_ts, unique_attack_types)
         session_risk = self._calculate_session_risk(risk_indicators)
         action = self._determine_action(session_risk, session)
         
@@ -64,31 +92,37 @@ class BehavioralMonitor:
             "details": {
                 "total_queries": session["query_count"],
                 "flagged_queries": session["flagged_queries"],
-                "session_duration_minutes": self._get_session_duration(session),
-                "unique_attack_types": len(set(flag[0] for flag in session["attack_patterns"]))
+                "session_duration_minutes": self._get_session_duration(session, now),
+                "unique_attack_types": unique_attack_types
             }
         }
     
-    def _create_new_session(self) -> Dict:
+    def _create_new_session(self, now: datetime, now_ts: float) -> Dict:
         """Creates a new session tracking object"""
         return {
             "query_count": 0,
             "flagged_queries": 0,
-            "attack_patterns": [],
-            "queries": [],
-            "start_time": datetime.now(),
-            "last_activity": datetime.now(),
+            "attack_patterns": deque(maxlen=self.ATTACK_HISTORY_WINDOW),
+            "attack_type_counts": Counter(),
+            # Per-query history kept as parallel sequences; flags are 0/1 so detectors can sum() them
+            "query_flags": deque(maxlen=self.QUERY_HISTORY_WINDOW),
+            "query_times": deque(maxlen=self.QUERY_HISTORY_WINDOW),
+            "query_texts": deque(maxlen=self.QUERY_HISTORY_WINDOW),
+            "opening_flags": [],
+            "start_time": now,
+            "start_time_ts": now_ts,  # monotonic seconds, for rate checks
+            "last_activity": now,
             "warnings_issued": 0,
             "rate_limited": False
         }
     
-    def _detect_risk_patterns(self, session: Dict) -> List[str]:
+    def _detect_risk_patterns(self, session: Dict, now_ts: float, unique_attack_types: int) -> List[str]:
         """Detects suspicious behavioral patterns"""
         indicators = []
         
         # Rapid-fire queries
         if session["query_count"] >= self.RAPID_QUERY_THRESHOLD:
-            duration = (datetime.now() - session["start_time"]).seconds
+            duration = now_ts - session["start_time_ts"]
             if duration < self.RAPID_QUERY_WINDOW:
                 indicators.append("RAPID_QUERY_PATTERN")
         
@@ -99,7 +133,6 @@ class BehavioralMonitor:
                 indicators.append("HIGH_ATTACK_RATIO")
         
         # Systematic pattern testing
-        unique_attack_types = len(set(flag[0] for flag in session["attack_patterns"]))
         if unique_attack_types >= self.SYSTEMATIC_PROBING_THRESHOLD:
             indicators.append("SYSTEMATIC_PROBING")
         
@@ -119,34 +152,34 @@ class BehavioralMonitor:
     
     def _detect_escalation(self, session: Dict) -> bool:
         """Detects if attacks are becoming more severe over time"""
-        if len(session["queries"]) < 5:
+        query_flags = session["query_flags"]
+        if len(query_flags) < 5:
             return False
         
-        midpoint = len(session["queries"]) // 2
-        first_half = session["queries"][:midpoint]
-        second_half = session["queries"][midpoint:]
+        midpoint = len(query_flags) // 2
+        second_half_len = len(query_flags) - midpoint
         
-        first_half_flagged = sum(1 for q in first_half if q["was_flagged"])
-        second_half_flagged = sum(1 for q in second_half if q["was_flagged"])
+        first_half_flagged = sum(islice(query_flags, midpoint))
+        second_half_flagged = sum(query_flags) - first_half_flagged
         
-        if len(second_half) > 0:
-            second_ratio = second_half_flagged / len(second_half)
-            if len(first_half) > 0:
-                first_ratio = first_half_flagged / len(first_half)
+        if second_half_len > 0:
+            second_ratio = second_half_flagged / second_half_len
+            if midpoint > 0:
+                first_ratio = first_half_flagged / midpoint
                 return second_ratio > first_ratio + 0.3
         
         return False
     
     def _detect_trust_building(self, session: Dict) -> bool:
         """Detects pattern of legitimate queries followed by malicious ones"""
-        if len(session["queries"]) < 4:
+        query_flags = session["query_flags"]
+        if len(query_flags) < 4:
             return False
         
-        recent_queries = session["queries"][-5:]
-        early_queries = session["queries"][:3]
+        early_queries = session["opening_flags"]
         
-        early_safe = sum(1 for q in early_queries if not q["was_flagged"])
-        recent_flagged = sum(1 for q in recent_queries if q["was_flagged"])
+        early_safe = len(early_queries) - sum(early_queries)
+        recent_flagged = sum(islice(reversed(query_flags), 5))
         
         return early_safe >= 2 and recent_flagged >= 3
     
@@ -155,25 +188,17 @@ class BehavioralMonitor:
         if len(session["attack_patterns"]) < 5:
             return False
         
-        attack_counts = defaultdict(int)
-        for flag_type, _ in session["attack_patterns"]:
-            attack_counts[flag_type] += 1
-        
-        return any(count >= 4 for count in attack_counts.values())
+        return any(count >= 4 for count in session["attack_type_counts"].values())
     
     def _calculate_session_risk(self, indicators: List[str]) -> str:
         """Categorizes overall session risk level"""
         if not indicators:
             return "NORMAL"
         
-        high_severity = ["SYSTEMATIC_PROBING", "ESCALATING_ATTACKS", "FUZZING_ATTACK"]
-        
-        if any(ind in high_severity for ind in indicators):
+        if not self._HIGH_SEVERITY.isdisjoint(indicators):
             return "HIGH"
-        elif len(indicators) >= 2:
-            return "ELEVATED"
-        else:
-            return "ELEVATED"
+        
+        return "ELEVATED"
     
     def _determine_action(self, risk_level: str, session: Dict) -> str:
         """Determines what action to take based on risk assessment"""
@@ -196,22 +221,34 @@ class BehavioralMonitor:
         
         return "CONTINUE"
     
-    def _get_session_duration(self, session: Dict) -> float:
+    def _get_session_duration(self, session: Dict, now: datetime) -> float:
         """Calculates session duration in minutes"""
-        duration = datetime.now() - session["start_time"]
+        duration = now - session["start_time"]
         return duration.total_seconds() / 60
     
-    def _cleanup_expired_sessions(self):
+    def _cleanup_expired_sessions(self, now: datetime):
         """Removes sessions that have exceeded timeout"""
-        current_time = datetime.now()
-        expired = []
-        
-        for session_id, session in self.user_sessions.items():
-            if current_time - session["last_activity"] > self.session_timeout:
-                expired.append(session_id)
-        
-        for session_id in expired:
-            del self.user_sessions[session_id]
+        heap = self._expiry_heap
+        
+        while heap and heap[0][0] < now:
+            _, session_id = heapq.heappop(heap)
+            session = self.user_sessions.get(session_id)
+            if session is None:
+                continue
+            
+            # Activity since the entry was pushed only moves the expiry later
+            if now - session["last_activity"] > self.session_timeout:
+                del self.user_sessions[session_id]
+            else:
+                heapq.heappush(heap, (session["last_activity"] + self.session_timeout, session_id))
+    
+    def _rebuild_expiry_heap(self):
+        """Rebuilds the expiry heap with exactly one entry per live session"""
+        self._expiry_heap = [
+            (session["last_activity"] + self.session_timeout, session_id)
+            for session_id, session in self.user_sessions.items()
+        ]
+        heapq.heapify(self._expiry_heap)
     
     def get_session_summary(self, session_id: str) -> Dict:
         """Returns detailed summary of a session"""
@@ -220,16 +257,14 @@ class BehavioralMonitor:
         
         session = self.user_sessions[session_id]
         
-        attack_distribution = defaultdict(int)
-        for flag_type, _ in session["attack_patterns"]:
-            attack_distribution[flag_type] += 1
+        attack_distribution = session["attack_type_counts"]
         
         return {
             "session_id": session_id,
             "total_queries": session["query_count"],
             "flagged_queries": session["flagged_queries"],
             "attack_ratio": session["flagged_queries"] / session["query_count"] if session["query_count"] > 0 else 0,
-            "duration_minutes": self._get_session_duration(session),
+            "duration_minutes": self._get_session_duration(session, datetime.now()),
             "unique_attack_types": len(attack_distribution),
             "attack_distribution": dict(attack_distribution),
             "warnings_issued": session["warnings_issued"],
@@ -8,6 +8,10 @@ import re
 from typing import Dict, List, Tuple
 from datetime import datetime
 
+# Characters that re.IGNORECASE matches against ASCII letters but str.lower() does not map
+# (U+0130 would also lower to two characters and shift match spans)
+_IGNORECASE_FOLD = str.maketrans({"\u0130": "i", "\u0131": "i", "\u017f": "s"})
+
 
 class PromptSecurityValidator:
     """Pre-processes user inputs to detect and neutralize prompt injection attempts"""
@@ -17,27 +21,19 @@ class PromptSecurityValidator:
         r'ignore (all |previous )?instructions',
         r'you are now (a |an )?',
         r'repeat (back )?your (system )?instructions',
-        r'admin mode|system mode|developer mode',
         r'disregard (all |previous )?rules',
         r'new (role|instructions|rules)',
-        r'SYSTEM:|ADMIN:|OVERRIDE:',
-        r'<\|system\|>|<\|admin\|>',
         r'forget (all |previous )?instructions',
         r'act as (a |an )?',
         r'pretend (to be|you are)',
-        r'your new role is',
     ]
     
     # Patterns indicating jailbreak attempts
     JAILBREAK_PATTERNS = [
         r"i'm writing (a novel|a story|fiction|a book)",
-        r"hypothetically speaking",
         r"for (educational|research|academic) purposes only",
         r"according to (a )?recent (ruling|law|case)",
-        r"in a fictional scenario",
         r"imagine (you are|that)",
-        r"let's play a game where",
-        r"what would you do if",
     ]
     
     # Patterns suggesting evasion intent
@@ -45,16 +41,67 @@ class PromptSecurityValidator:
         r"(how to|ways to) (avoid|evade|escape|get out of)",
         r"loopholes? (in|for)",
         r"tricks? to (avoid|evade)",
-        r"get away with",
-        r"without getting caught",
         r"bypass (the )?(law|rule|regulation)",
     ]
     
+    # Plain-literal patterns, matched by substring search on the folded query.
+    # Each inner tuple is one pattern: its alternatives yield at most one flag.
+    LITERAL_MALICIOUS = (
+        ("admin mode", "system mode", "developer mode"),
+        ("system:", "admin:", "override:"),
+        ("<|system|>", "<|admin|>"),
+        ("your new role is",),
+    )
+    LITERAL_JAILBREAK = (
+        ("hypothetically speaking",),
+        ("in a fictional scenario",),
+        ("let's play a game where",),
+        ("what would you do if",),
+    )
+    LITERAL_EVASION = (
+        ("get away with",),
+        ("without getting caught",),
+    )
+    
+    # Literal substrings present in every match of the pattern lists above;
+    # a category's patterns are only searched when one of its triggers appears
+    MALICIOUS_TRIGGERS = (
+        "ignore", "you are now", "repeat", "admin mode", "system mode", "developer mode",
+        "disregard", "new ", "system:", "admin:", "override:", "<|", "forget", "act as", "pretend",
+    )
+    JAILBREAK_TRIGGERS = (
+        "i'm writing", "hypothetically speaking", "purposes only", "according to",
+        "in a fictional scenario", "imagine", "let's play a game where", "what would you do if",
+    )
+    EVASION_TRIGGERS = (
+        "avoid", "evade", "escape", "get out of", "loophole", "trick",
+        "get away with", "without getting caught", "bypass",
+    )
+    
     def __init__(self):
-        # Compile patterns for better performance
-        self.malicious_regex = [re.compile(p, re.IGNORECASE) for p in self.MALICIOUS_PATTERNS]
-        self.jailbreak_regex = [re.compile(p, re.IGNORECASE) for p in self.JAILBREAK_PATTERNS]
-        self.evasion_regex = [re.compile(p, re.IGNORECASE) for p in self.EVASION_PATTERNS]
+        # Compile patterns for better performance. They are matched against the
+        # case-folded query, so they are lowered here instead of using re.IGNORECASE
+        # (none of them use case-sensitive escapes such as \S or \W).
+        self.malicious_regex = [re.compile(p.lower()) for p in self.MALICIOUS_PATTERNS]
+        self.jailbreak_regex = [re.compile(p.lower()) for p in self.JAILBREAK_PATTERNS]
+        self.evasion_regex = [re.compile(p.lower()) for p in self.EVASION_PATTERNS]
+        self._year_run_re = re.compile(r'\d{4}')
+        self._citation_re = re.compile(r'\b\w+\s+v\.?\s+\w+\s*\(?\s*(?P<year>\d{4})\s*\)?', re.IGNORECASE)
+        self._base64_re = re.compile(r'[A-Za-z0-9+/]{20,}={0,2}')
+        self._hex_re = re.compile(r'(?:0x|\\x)[0-9a-fA-F]{2,}')
+        self._strip_special = str.maketrans('', '', '!@#$%^&*()_+-=[]{}|;:,.<>?~`')
+        
+        # (flag_type, triggers, bound searches, literals) table so validate_input runs a single loop.
+        # Patterns stay separate stdlib regexes: each keeps its own literal-prefix search
+        # and leftmost-match semantics, which a merged multi-pattern scanner would change.
+        self._pattern_checks = tuple(
+            (flag_type, triggers, tuple(pattern.search for pattern in patterns), literals)
+            for flag_type, triggers, patterns, literals in (
+                ("INJECTION_ATTEMPT", self.MALICIOUS_TRIGGERS, self.malicious_regex, self.LITERAL_MALICIOUS),
+                ("JAILBREAK_ATTEMPT", self.JAILBREAK_TRIGGERS, self.jailbreak_regex, self.LITERAL_JAILBREAK),
+                ("EVASION_INTENT", self.EVASION_TRIGGERS, self.evasion_regex, self.LITERAL_EVASION),
+            )
+        )
     
     def validate_input(self, user_query: str) -> Dict:
         """
@@ -68,25 +115,25 @@ class PromptSecurityValidator:
                 - sanitized_query: str or None
         """
         flags = []
-        query_lower = user_query.lower()
-        
-        # Check for direct injection attempts
-        for pattern in self.malicious_regex:
-            match = pattern.search(user_query)
-            if match:
-                flags.append(("INJECTION_ATTEMPT", match.group(0)))
-        
-        # Check for jailbreak attempts
-        for pattern in self.jailbreak_regex:
-            match = pattern.search(user_query)
-            if match:
-                flags.append(("JAILBREAK_ATTEMPT", match.group(0)))
-        
-        # Check for evasion intent
-        for pattern in self.evasion_regex:
-            match = pattern.search(user_query)
-            if match:
-                flags.append(("EVASION_INTENT", match.group(0)))
+        query_lower = user_query.translate(_IGNORECASE_FOLD).lower()
+        
+        # Check for injection, jailbreak and evasion patterns
+        for flag_type, triggers, searches, literal_groups in self._pattern_checks:
+            if not any(trigger in query_lower for trigger in triggers):
+                continue
+            for search in searches:
+                match = search(query_lower)
+                if match:
+                    # Folding keeps one character per character, so spans map back
+                    flags.append((flag_type, user_query[match.start():match.end()]))
+            for literals in literal_groups:
+                start = -1
+                for literal in literals:
+                    pos = query_lower.find(literal)
+                    if pos >= 0 and (start < 0 or pos < start):
+                        start, end = pos, pos + len(literal)
+                if start >= 0:
+                    flags.append((flag_type, user_query[start:end]))
         
         # Check for fake citations
         if self._has_suspicious_citation(user_query):
@@ -112,44 +159,48 @@ class PromptSecurityValidator:
     
     def _has_suspicious_citation(self, query: str) -> bool:
         """Detects potentially fabricated legal citations"""
-        citation_pattern = r'\b\w+\s+v\.?\s+\w+\s*\(?\s*\d{4}\s*\)?'
+        # Every citation carries a 4-digit year; most queries have none
+        if not self._year_run_re.search(query):
+            return False
         
-        current_year = datetime.now().year
-        matches = re.finditer(citation_pattern, query, re.IGNORECASE)
+        current_year = None
         
-        for match in matches:
-            year_match = re.search(r'\d{4}', match.group(0))
-            if year_match:
-                year = int(year_match.group(0))
-                if year >= current_year:
-                    return True
+        for match in self._citation_re.finditer(query):
+            if current_year is None:
+                current_year = datetime.now().year
+            if int(match.group('year')) >= current_year:
+                return True
         
         return False
     
     def _has_encoding_attempt(self, query: str) -> bool:
         """Detects Base64, hex, or other encoding schemes"""
-        base64_pattern = r'[A-Za-z0-9+/]{20,}={0,2}'
-        if re.search(base64_pattern, query):
-            potential_b64 = re.findall(base64_pattern, query)
-            for b64 in potential_b64:
-                if len(b64) % 4 == 0 or b64.endswith('='):
-                    return True
-        
-        hex_pattern = r'(?:0x|\\x)[0-9a-fA-F]{2,}'
-        if re.search(hex_pattern, query):
+        for match in self._base64_re.finditer(query):
+            b64 = match.group(0)
+            if len(b64) % 4 == 0 or b64.endswith('='):
+                return True
+        
+        if ('0x' in query or '\\x' in query) and self._hex_re.search(query):
             return True
         
         return False
     
     def _has_obfuscation(self, query: str) -> bool:
         """Detects unusual Unicode or character obfuscation"""
-        unicode_count = sum(1 for c in query if ord(c) > 127)
-        
-        if len(query) > 0 and (unicode_count / len(query)) > 0.2:
-            return True
-        
-        special_chars = sum(1 for c in query if c in '!@#$%^&*()_+-=[]{}|;:,.<>?~`')
-        if len(query) > 0 and (special_chars / len(query)) > 0.3:
+        length = len(query)
+        if length == 0:
+            return False
+        
+        # Count by the length lost when dropping characters, both done in C.
+        # isascii() is O(1) on CPython's compact strings, so plain ASCII input
+        # skips the encode copy entirely.
+        if not query.isascii():
+            unicode_count = length - len(query.encode('ascii', 'ignore'))
+            if (unicode_count / length) > 0.2:
+                return True
+        
+        special_chars = length - len(query.translate(self._strip_special))
+        if (special_chars / length) > 0.3:
             return True
         
         return False
@@ -7,6 +7,35 @@ File: security/output_validator.py
 import re
 from typing import Dict, List, Tuple
 
+# Extra case folds re.IGNORECASE applies to ASCII i/s; also keeps lowering one-to-one
+_IGNORECASE_FOLD = str.maketrans({"\u0130": "i", "\u0131": "i", "\u017f": "s"})
+
+# Query wording that asks for evasion help
+_EVASION_KEYWORDS = ('evade', 'avoid getting caught', 'trick', 'get away with')
+
+# Response wording that hands out evasion strategies (general prevention tips are fine)
+_STRATEGY_PHRASES = (
+    'you could avoid detection',
+    'ways to evade',
+    'trick the officer',
+    'avoid getting caught',
+)
+
+# Marker of the disclaimer _apply_safety_layer appends, and the wording that triggers it.
+# Keywords are substrings on purpose so "law" also covers "laws" and "lawyer".
+_DISCLAIMER_MARKER = "not constitute legal advice"
+_LEGAL_KEYWORDS = ('statute', 'law', 'penalty', 'violation', 'court', 'legal')
+
+_FACTUAL_RES = tuple(re.compile(p, re.IGNORECASE) for p in (
+    r'\bwhat is\b',
+    r'\bwhat are\b',
+    r'\bhow much\b',
+    r'\bwhen\b',
+    r'\bwhere\b',
+    r'\bpenalty for\b',
+    r'\blimit\b',
+))
+
 
 class ResponseValidator:
     """Validates generated responses for security violations"""
@@ -40,9 +69,15 @@ class ResponseValidator:
         "your strategy should be",
     ]
     
-    def __init__(self):
-        self.prohibited_regex = [re.compile(p, re.IGNORECASE) for p in self.PROHIBITED_CONTENT]
-        self.role_violation_regex = [re.compile(p, re.IGNORECASE) for p in self.ROLE_VIOLATION_INDICATORS]
+    # (issue_type, phrase) table built once with the class, so instances need no setup.
+    # Phrases are folded the same way as the response and deduplicated, so a
+    # substring search on one lowered copy of the response replaces a regex search
+    # per phrase. A single IGNORECASE alternation with finditer is much slower here
+    # and would miss overlapping phrases ("avoid detection" inside "how to avoid detection").
+    _phrase_checks = tuple(dict.fromkeys(
+        [("PROHIBITED_ADVICE", phrase.translate(_IGNORECASE_FOLD).lower()) for phrase in PROHIBITED_CONTENT] +
+        [("ROLE_VIOLATION", phrase.translate(_IGNORECASE_FOLD).lower()) for phrase in ROLE_VIOLATION_INDICATORS]
+    ))
     
     def validate_response(self, response: str, original_query: str) -> Dict:
         """
@@ -57,20 +92,22 @@ class ResponseValidator:
         """
         issues = []
         
-        # Check for prohibited advisory language
-        for pattern in self.prohibited_regex:
-            match = pattern.search(response)
-            if match:
-                issues.append(("PROHIBITED_ADVICE", match.group(0)))
+        response_lower = response.translate(_IGNORECASE_FOLD).lower()
+        
+        blocked = False
         
-        # Check for role boundary violations
-        for pattern in self.role_violation_regex:
-            match = pattern.search(response)
-            if match:
-                issues.append(("ROLE_VIOLATION", match.group(0)))
+        # Check for prohibited advisory language and role boundary violations
+        for issue_type, phrase in self._phrase_checks:
+            pos = response_lower.find(phrase)
+            if pos >= 0:
+                issues.append((issue_type, response[pos:pos + len(phrase)]))
+                # Any role violation or a third issue means BLOCK; further issues change nothing
+                if issue_type == "ROLE_VIOLATION" or len(issues) >= 3:
+                    blocked = True
+                    break
         
         # Check if response is answering a suspicious query appropriately
-        if self._should_have_refused(original_query, response):
+        if not blocked and self._should_have_refused(original_query, response):
             issues.append(("INAPPROPRIATE_COMPLIANCE", "Response should have refused this query"))
         
         # NOTE: Removed strict citation validation - it was too aggressive
@@ -97,16 +134,10 @@ class ResponseValidator:
         response_lower = response.lower()
         
         # Check if query is asking for evasion
-        evasion_keywords = ['evade', 'avoid getting caught', 'trick', 'get away with']
-        query_has_evasion = any(kw in query_lower for kw in evasion_keywords)
+        query_has_evasion = any(kw in query_lower for kw in _EVASION_KEYWORDS)
         
         # Check if response provides strategies (but allow general prevention tips)
-        response_provides_strategy = any(phrase in response_lower for phrase in [
-            'you could avoid detection',
-            'ways to evade',
-            'trick the officer',
-            'avoid getting caught'
-        ])
+        response_provides_strategy = any(phrase in response_lower for phrase in _STRATEGY_PHRASES)
         
         # Only flag if query asks for evasion AND response provides evasion strategies
         if query_has_evasion and response_provides_strategy:
@@ -116,25 +147,15 @@ class ResponseValidator:
     
     def _is_factual_query(self, query: str) -> bool:
         """Determines if query expects a factual answer"""
-        factual_indicators = [
-            r'\bwhat is\b',
-            r'\bwhat are\b',
-            r'\bhow much\b',
-            r'\bwhen\b',
-            r'\bwhere\b',
-            r'\bpenalty for\b',
-            r'\blimit\b',
-        ]
-        
-        return any(re.search(p, query, re.IGNORECASE) for p in factual_indicators)
+        return any(p.search(query) for p in _FACTUAL_RES)
     
     def _apply_safety_layer(self, response: str, issues: List[Tuple[str, str]]) -> str:
         """Adds disclaimers to responses when appropriate"""
-        if "not constitute legal advice" in response.lower():
+        response_lower = response.lower()
+        if _DISCLAIMER_MARKER in response_lower:
             return response
         
-        legal_keywords = ['statute', 'law', 'penalty', 'violation', 'court', 'legal']
-        if any(kw in response.lower() for kw in legal_keywords):
+        if any(kw in response_lower for kw in _LEGAL_KEYWORDS):
             disclaimer = (
                 "\n\n⚠️ **IMPORTANT**: This information is for educational purposes only "
                 "and does not constitute legal advice. For guidance on your specific situation, "
@@ -3,10 +3,17 @@ DriveSmart AI - Initial Assessment Framework
 Run this to evaluate your current system before fine-tuning
 """
 
-import json
 import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import nullcontext
 from datetime import datetime
 
+from io_utils import json_line, save_report
+
+# Response quality indicators, matched against the lowercased response
+CITATION_TERMS = ("code", "section", "statute", "regulation", "cvc", "dmv")
+DISCLAIMER_TERMS = ("not legal advice", "consult", "attorney", "lawyer")
+
 # Define test scenarios covering different user personas and query types
 TEST_SCENARIOS = [
     # Individual Driver Queries
@@ -71,6 +78,11 @@ TEST_SCENARIOS = [
     },
 ]
 
+# Topics are constants, so lowercase them once instead of on every scored response
+for _scenario in TEST_SCENARIOS:
+    _scenario["expected_topics_lc"] = tuple(topic.lower() for topic in _scenario["expected_topics"])
+del _scenario
+
 
 class AssessmentEvaluator:
     def __init__(self, chatbot_function):
@@ -80,73 +92,127 @@ class AssessmentEvaluator:
         """
         self.chatbot = chatbot_function
         self.results = []
+        self.results_path = None
+        
+        # Running totals folded in as results arrive, so reports never rescan the results
+        self._result_count = 0
+        self._successful = 0
+        self._total_time = 0.0
+        self._total_coverage = 0.0
+        self._citations = 0
+        self._disclaimers = 0
+        self._persona_totals = {}  # persona -> [count, topic_coverage sum, response_time_ms sum]
     
     def evaluate_response(self, scenario, response, response_time):
         """Evaluate a single response against expected criteria"""
+        response_lower = response.lower()
+        length = len(response)
         
-        # Check topic coverage
-        topics_found = sum(
-            1 for topic in scenario["expected_topics"] 
-            if topic.lower() in response.lower()
-        )
-        topic_coverage = topics_found / len(scenario["expected_topics"])
+        # Check topic coverage (scenarios outside TEST_SCENARIOS may lack the lowered topics)
+        topics = scenario.get("expected_topics_lc")
+        if topics is None:
+            topics = [topic.lower() for topic in scenario["expected_topics"]]
+        topics_found = sum(1 for topic in topics if topic in response_lower)
+        topic_coverage = topics_found / len(topics)
         
         # Check response quality indicators
-        has_citation = any(phrase in response.lower() for phrase in 
-                         ["code", "section", "statute", "regulation", "cvc", "dmv"])
-        has_disclaimer = any(phrase in response.lower() for phrase in 
-                           ["not legal advice", "consult", "attorney", "lawyer"])
-        is_clear = len(response) > 100 and len(response) < 2000
+        has_citation = any(phrase in response_lower for phrase in CITATION_TERMS)
+        has_disclaimer = any(phrase in response_lower for phrase in DISCLAIMER_TERMS)
+        is_clear = 100 < length < 2000
         
         return {
             "scenario_id": scenario["id"],
             "persona": scenario["persona"],
             "query": scenario["query"],
-            "response_length": len(response),
+            "response_length": length,
             "response_time_ms": response_time,
             "topic_coverage": topic_coverage,
             "has_legal_citation": has_citation,
             "has_disclaimer": has_disclaimer,
             "appropriate_length": is_clear,
-            "response_preview": response[:500] + "..." if len(response) > 500 else response
+            "response_preview": response[:500] + "..." if length > 500 else response
         }
     
-    def run_assessment(self):
-        """Run full assessment on all test scenarios"""
+    def _run_scenario(self, scenario):
+        """Query the chatbot for one scenario; returns (result, response_time_ms)"""
+        # Time the response
+        start = time.time()
+        try:
+            response = self.chatbot(scenario["query"])
+            response_time = (time.time() - start) * 1000
+            
+            result = self.evaluate_response(scenario, response, response_time)
+            result["status"] = "success"
+            
+        except Exception as e:
+            result = {
+                "scenario_id": scenario["id"],
+                "status": "error",
+                "error": str(e)
+            }
+            response_time = (time.time() - start) * 1000
+        
+        return result, response_time
+    
+    def _record_result(self, result):
+        """Fold one scenario result into the running report totals"""
+        self._result_count += 1
+        if result.get("status") != "success":
+            return
+        
+        self._successful += 1
+        self._total_time += result["response_time_ms"]
+        self._total_coverage += result["topic_coverage"]
+        self._citations += result["has_legal_citation"]
+        self._disclaimers += result["has_disclaimer"]
+        
+        totals = self._persona_totals.get(result["persona"])
+        if totals is None:
+            totals = self._persona_totals[result["persona"]] = [0, 0.0, 0.0]
+        totals[0] += 1
+        totals[1] += result["topic_coverage"]
+        totals[2] += result["response_time_ms"]
+    
+    def run_assessment(self, max_workers=8, results_path=None):
+        """
+        Run full assessment on all test scenarios
+        
+        Chatbot calls are I/O bound, so up to max_workers scenarios are queried
+        concurrently; results are still recorded in scenario order.
+        
+        If results_path is given, each result is written there as one JSON line as
+        soon as it is scored instead of being kept in self.results, and the report
+        references that file rather than embedding the detailed results.
+        """
         print("=" * 60)
         print("DriveSmart AI - Initial Assessment")
         print(f"Date: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
         print("=" * 60)
         
-        for scenario in TEST_SCENARIOS:
-            print(f"\nTesting: {scenario['id']} ({scenario['persona']})")
-            print(f"Query: {scenario['query'][:50]}...")
-            
-            # Time the response
-            start = time.time()
-            try:
-                response = self.chatbot(scenario["query"])
-                response_time = (time.time() - start) * 1000
-                
-                result = self.evaluate_response(scenario, response, response_time)
-                result["status"] = "success"
-                
-            except Exception as e:
-                result = {
-                    "scenario_id": scenario["id"],
-                    "status": "error",
-                    "error": str(e)
-                }
-                response_time = (time.time() - start) * 1000
+        self.results_path = results_path
+        results_sink = open(results_path, "wb") if results_path else nullcontext()
+        
+        with results_sink as results_file, ThreadPoolExecutor(max_workers=max_workers) as executor:
+            outcomes = executor.map(self._run_scenario, TEST_SCENARIOS)
             
-            self.results.append(result)
-            print(f"  Status: {result['status']}, Time: {response_time:.0f}ms")
+            # Progress is printed only from this thread, one write per scenario
+            for scenario, (result, response_time) in zip(TEST_SCENARIOS, outcomes):
+                self._record_result(result)
+                if results_file is None:
+                    self.results.append(result)
+                else:
+                    results_file.write(json_line(result))
+                print(
+                    f"\nTesting: {scenario['id']} ({scenario['persona']})\n"
+                    f"Query: {scenario['query'][:50]}...\n"
+                    f"  Status: {result['status']}, Time: {response_time:.0f}ms"
+                )
         
         return self.generate_report()
     
     def generate_report(self):
-        """Generate assessment summary report"""
-        successful = [r for r in self.results if r.get("status") == "success"]
+        """Generate assessment summary report from the running totals"""
+        successful = self._successful
         
         if not successful:
             return {"error": "No successful responses to analyze"}
@@ -154,25 +220,23 @@ class AssessmentEvaluator:
         report = {
             "summary": {
                 "total_scenarios": len(TEST_SCENARIOS),
-                "successful": len(successful),
-                "failed": len(self.results) - len(successful),
-                "avg_response_time_ms": sum(r["response_time_ms"] for r in successful) / len(successful),
-                "avg_topic_coverage": sum(r["topic_coverage"] for r in successful) / len(successful),
-                "citation_rate": sum(1 for r in successful if r["has_legal_citation"]) / len(successful),
-                "disclaimer_rate": sum(1 for r in successful if r["has_disclaimer"]) / len(successful),
+                "successful": successful,
+                "failed": self._result_count - successful,
+                "avg_response_time_ms": self._total_time / successful,
+                "avg_topic_coverage": self._total_coverage / successful,
+                "citation_rate": self._citations / successful,
+                "disclaimer_rate": self._disclaimers / successful,
             },
             "by_persona": {},
             "areas_for_improvement": [],
-            "detailed_results": self.results
+            "detailed_results": str(self.results_path) if self.results_path else self.results
         }
         
         # Analyze by persona
-        personas = set(r["persona"] for r in successful)
-        for persona in personas:
-            persona_results = [r for r in successful if r["persona"] == persona]
+        for persona, (count, coverage, response_time) in self._persona_totals.items():
             report["by_persona"][persona] = {
-                "avg_topic_coverage": sum(r["topic_coverage"] for r in persona_results) / len(persona_results),
-                "avg_response_time_ms": sum(r["response_time_ms"] for r in persona_results) / len(persona_results),
+                "avg_topic_coverage": coverage / count,
+                "avg_response_time_ms": response_time / count,
             }
         
         # Identify areas for improvement
@@ -199,8 +263,7 @@ def example_usage():
     report = evaluator.run_assessment()
     
     # Save report
-    with open("initial_assessment_report.json", "w") as f:
-        json.dump(report, f, indent=2)
+    save_report(report, "initial_assessment_report.json")
     
     print("\n" + "=" * 60)
     print("ASSESSMENT SUMMARY")
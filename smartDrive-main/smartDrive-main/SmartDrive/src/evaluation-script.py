@@ -3,10 +3,23 @@ DriveSmart AI - Post Fine-Tuning Evaluation
 Compare before/after performance to demonstrate improvement
 """
 
-import json
 import time
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
-from typing import Dict, List, Callable
+from typing import Dict, List, Callable, Tuple
+
+from io_utils import save_report
+
+# Scoring terms, matched against the lowercased response
+CITATION_TERMS = ("code", "section", "statute", "cvc", "regulation", "dmv")
+DISCLAIMER_TERMS = ("not legal advice", "consult", "attorney", "disclaimer")
+
+# Weights of each scoring dimension in total_score (sum to 1.0)
+TOPIC_COVERAGE_WEIGHT = 0.35
+CITATION_WEIGHT = 0.25
+DISCLAIMER_WEIGHT = 0.15
+LENGTH_WEIGHT = 0.15
+CLARITY_WEIGHT = 0.10
 
 # Import your assessment framework
 # from assessment_framework import TEST_SCENARIOS, AssessmentEvaluator
@@ -20,75 +33,103 @@ class ComparativeEvaluator:
             "baseline": [],
             "finetuned": []
         }
+    
+    @staticmethod
+    def _timed_call(fn: Callable, query: str) -> Tuple[str, float]:
+        """Call a model function, returning (response, elapsed_ms)"""
+        start = time.time()
+        response = fn(query)
+        return response, (time.time() - start) * 1000
+    
+    @classmethod
+    def _timed_pair(cls, baseline_fn: Callable, finetuned_fn: Callable, query: str) -> Tuple[Tuple[str, float], Tuple[str, float]]:
+        """Time both models on one query, one after the other, so neither call's latency
+        includes queueing behind the other model"""
+        return cls._timed_call(baseline_fn, query), cls._timed_call(finetuned_fn, query)
         
     def run_comparison(
         self, 
         baseline_fn: Callable, 
         finetuned_fn: Callable,
-        test_scenarios: List[Dict]
+        test_scenarios: List[Dict],
+        max_workers: int = 8
     ) -> Dict:
-        """Run same tests on both models"""
+        """
+        Run same tests on both models
+        
+        Model calls are I/O bound, so scenarios run on a pool of max_workers
+        threads; results keep scenario order. Within a scenario the baseline and
+        fine-tuned calls run sequentially, so both models see the same load when
+        response_time_ms is measured. baseline_fn and finetuned_fn must be safe to
+        call from several threads at once; pass max_workers=1 if they are not
+        (or to time every call in isolation).
+        """
         
         print("=" * 60)
         print("COMPARATIVE EVALUATION")
         print(f"Date: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
         print("=" * 60)
         
-        for scenario in test_scenarios:
-            print(f"\nScenario: {scenario['id']}")
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            # Scenarios run concurrently; each one's model calls stay sequential
+            pending = [
+                executor.submit(self._timed_pair, baseline_fn, finetuned_fn, scenario["query"])
+                for scenario in test_scenarios
+            ]
             
-            # Test baseline
-            start = time.time()
-            baseline_response = baseline_fn(scenario["query"])
-            baseline_time = (time.time() - start) * 1000
-            
-            # Test fine-tuned
-            start = time.time()
-            finetuned_response = finetuned_fn(scenario["query"])
-            finetuned_time = (time.time() - start) * 1000
-            
-            # Score both
-            baseline_score = self._score_response(scenario, baseline_response)
-            finetuned_score = self._score_response(scenario, finetuned_response)
-            
-            self.results["baseline"].append({
-                "scenario_id": scenario["id"],
-                "response_time_ms": baseline_time,
-                **baseline_score
-            })
-            
-            self.results["finetuned"].append({
-                "scenario_id": scenario["id"],
-                "response_time_ms": finetuned_time,
-                **finetuned_score
-            })
-            
-            # Show improvement
-            improvement = finetuned_score["total_score"] - baseline_score["total_score"]
-            symbol = "↑" if improvement > 0 else "↓" if improvement < 0 else "="
-            print(f"  Baseline: {baseline_score['total_score']:.2f} | Fine-tuned: {finetuned_score['total_score']:.2f} ({symbol}{abs(improvement):.2f})")
+            # Scoring and progress output stay on this thread, one write per scenario
+            for scenario, future in zip(test_scenarios, pending):
+                self._record_comparison(scenario, *future.result())
         
         return self._generate_comparison_report()
     
-    def _score_response(self, scenario: Dict, response: str) -> Dict:
-        """Score a response on multiple dimensions"""
+    def _record_comparison(self, scenario: Dict, baseline: Tuple[str, float], finetuned: Tuple[str, float]):
+        """Score one scenario's baseline and fine-tuned responses and record them"""
+        baseline_response, baseline_time = baseline
+        finetuned_response, finetuned_time = finetuned
+        
+        # Score both, lowercasing the expected topics once for the pair
+        topics_lc = [topic.lower() for topic in scenario["expected_topics"]]
+        baseline_score = self._score_response(scenario, baseline_response, topics_lc)
+        finetuned_score = self._score_response(scenario, finetuned_response, topics_lc)
+        
+        self.results["baseline"].append({
+            "scenario_id": scenario["id"],
+            "response_time_ms": baseline_time,
+            **baseline_score
+        })
+        
+        self.results["finetuned"].append({
+            "scenario_id": scenario["id"],
+            "response_time_ms": finetuned_time,
+            **finetuned_score
+        })
+        
+        # Show improvement
+        improvement = finetuned_score["total_score"] - baseline_score["total_score"]
+        symbol = "↑" if improvement > 0 else "↓" if improvement < 0 else "="
+        print(
+            f"\nScenario: {scenario['id']}\n"
+            f"  Baseline: {baseline_score['total_score']:.2f} | Fine-tuned: {finetuned_score['total_score']:.2f} ({symbol}{abs(improvement):.2f})"
+        )
+    
+    def _score_response(self, scenario: Dict, response: str, topics_lc: List[str] = None) -> Dict:
+        """Score a response on multiple dimensions (topics_lc: pre-lowercased expected topics)"""
         
         scores = {}
+        response_lower = response.lower()
+        if topics_lc is None:
+            topics_lc = [topic.lower() for topic in scenario["expected_topics"]]
         
         # 1. Topic Coverage (0-1)
-        topics_found = sum(
-            1 for topic in scenario["expected_topics"]
-            if topic.lower() in response.lower()
-        )
-        scores["topic_coverage"] = topics_found / len(scenario["expected_topics"])
+        topics_found = sum(1 for topic in topics_lc if topic in response_lower)
+        scores["topic_coverage"] = topics_found / len(topics_lc)
         
         # 2. Has Legal Citation (0-1)
-        citation_terms = ["code", "section", "statute", "cvc", "regulation", "dmv"]
-        scores["has_citation"] = 1.0 if any(t in response.lower() for t in citation_terms) else 0.0
+        scores["has_citation"] = 1.0 if any(t in response_lower for t in CITATION_TERMS) else 0.0
         
         # 3. Has Disclaimer (0-1)
-        disclaimer_terms = ["not legal advice", "consult", "attorney", "disclaimer"]
-        scores["has_disclaimer"] = 1.0 if any(t in response.lower() for t in disclaimer_terms) else 0.0
+        scores["has_disclaimer"] = 1.0 if any(t in response_lower for t in DISCLAIMER_TERMS) else 0.0
         
         # 4. Response Quality (0-1) - based on length appropriateness
         length = len(response)
@@ -104,16 +145,12 @@ class ComparativeEvaluator:
         scores["clarity"] = 1.0 if has_structure else 0.5
         
         # Total weighted score
-        weights = {
-            "topic_coverage": 0.35,
-            "has_citation": 0.25,
-            "has_disclaimer": 0.15,
-            "length_score": 0.15,
-            "clarity": 0.10
-        }
-        
-        scores["total_score"] = sum(
-            scores[k] * weights[k] for k in weights
+        scores["total_score"] = (
+            scores["topic_coverage"] * TOPIC_COVERAGE_WEIGHT
+            + scores["has_citation"] * CITATION_WEIGHT
+            + scores["has_disclaimer"] * DISCLAIMER_WEIGHT
+            + scores["length_score"] * LENGTH_WEIGHT
+            + scores["clarity"] * CLARITY_WEIGHT
         )
         
         return scores
@@ -121,28 +158,36 @@ class ComparativeEvaluator:
     def _generate_comparison_report(self) -> Dict:
         """Generate detailed comparison report"""
         
-        def avg(results, key):
-            return sum(r[key] for r in results) / len(results) if results else 0
+        def metrics(results):
+            """Average every reported metric in one pass over the results"""
+            total_score = topic_coverage = response_time = citation = disclaimer = 0.0
+            for r in results:
+                total_score += r["total_score"]
+                topic_coverage += r["topic_coverage"]
+                response_time += r["response_time_ms"]
+                citation += r["has_citation"]
+                disclaimer += r["has_disclaimer"]
+            
+            n = len(results)
+            if not n:
+                return dict.fromkeys(
+                    ("avg_total_score", "avg_topic_coverage", "avg_response_time_ms", "citation_rate", "disclaimer_rate"), 0
+                )
+            return {
+                "avg_total_score": total_score / n,
+                "avg_topic_coverage": topic_coverage / n,
+                "avg_response_time_ms": response_time / n,
+                "citation_rate": citation / n,
+                "disclaimer_rate": disclaimer / n,
+            }
         
         report = {
             "summary": {
                 "num_scenarios": len(self.results["baseline"]),
                 "timestamp": datetime.now().isoformat()
             },
-            "baseline_metrics": {
-                "avg_total_score": avg(self.results["baseline"], "total_score"),
-                "avg_topic_coverage": avg(self.results["baseline"], "topic_coverage"),
-                "avg_response_time_ms": avg(self.results["baseline"], "response_time_ms"),
-                "citation_rate": avg(self.results["baseline"], "has_citation"),
-                "disclaimer_rate": avg(self.results["baseline"], "has_disclaimer"),
-            },
-            "finetuned_metrics": {
-                "avg_total_score": avg(self.results["finetuned"], "total_score"),
-                "avg_topic_coverage": avg(self.results["finetuned"], "topic_coverage"),
-                "avg_response_time_ms": avg(self.results["finetuned"], "response_time_ms"),
-                "citation_rate": avg(self.results["finetuned"], "citation_rate") if "citation_rate" in self.results["finetuned"][0] else avg(self.results["finetuned"], "has_citation"),
-                "disclaimer_rate": avg(self.results["finetuned"], "has_disclaimer"),
-            },
+            "baseline_metrics": metrics(self.results["baseline"]),
+            "finetuned_metrics": metrics(self.results["finetuned"]),
             "improvements": {},
             "detailed_results": self.results
         }
@@ -259,8 +304,7 @@ def run_full_evaluation():
     # Print and save report
     evaluator.print_report(report)
     
-    with open("evaluation_report.json", "w") as f:
-        json.dump(report, f, indent=2)
+    save_report(report, "evaluation_report.json")
     
     print("\nReport saved to: evaluation_report.json")
     
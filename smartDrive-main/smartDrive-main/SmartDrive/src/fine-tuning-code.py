@@ -3,10 +3,18 @@ DriveSmart AI - Fine-Tuning Script (Self-Contained)
 This version includes the training data directly - no separate file needed
 """
 
+import hashlib
 import json
 import os
 from pathlib import Path
 
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+from io_utils import write_jsonl
+
 # =============================================================================
 # TRAINING DATA (embedded directly in script)
 # =============================================================================
@@ -90,34 +98,24 @@ RETRIEVAL_TRAINING_PAIRS = [
 ]
 
 
+TRAINING_DATA_PATH = "data/embedding_training_data.jsonl"
+
+
 def prepare_training_data():
-    """Prepare and save training data"""
-    
-    training_data = {
-        "queries": {},
-        "corpus": {},
-        "relevant_docs": {}
-    }
-    
-    for idx, pair in enumerate(RETRIEVAL_TRAINING_PAIRS):
-        query_id = f"q{idx}"
-        pos_id = f"pos{idx}"
-        neg_id = f"neg{idx}"
-        
-        training_data["queries"][query_id] = pair["query"]
-        training_data["corpus"][pos_id] = pair["positive"]
-        training_data["corpus"][neg_id] = pair["hard_negative"]
-        training_data["relevant_docs"][query_id] = [pos_id]
+    """Prepare and save training data - one {query, positive, hard_negative} record per line"""
     
     # Create data directory if it doesn't exist
     Path("data").mkdir(exist_ok=True)
     
     # Save to file
-    with open("data/embedding_training_data.json", "w") as f:
-        json.dump(training_data, f, indent=2)
+    records = (
+        {"query": pair["query"], "positive": pair["positive"], "hard_negative": pair["hard_negative"]}
+        for pair in RETRIEVAL_TRAINING_PAIRS
+    )
+    count = write_jsonl(records, TRAINING_DATA_PATH)
     
-    print(f"✓ Created training data with {len(RETRIEVAL_TRAINING_PAIRS)} examples")
-    return training_data
+    print(f"✓ Created training data with {count} examples")
+    return count
 
 
 def fine_tune_embeddings():
@@ -125,37 +123,65 @@ def fine_tune_embeddings():
     
     from sentence_transformers import SentenceTransformer, InputExample, losses
     from torch.utils.data import DataLoader
+    import torch
     
     print("=" * 60)
     print("EMBEDDING MODEL FINE-TUNING")
     print("=" * 60)
     
     # Check if data exists, create if not
-    data_path = "data/embedding_training_data.json"
+    data_path = TRAINING_DATA_PATH
     if not os.path.exists(data_path):
         print("\n⚠ Training data not found. Creating it now...")
         prepare_training_data()
     
-    # Load training data
-    with open(data_path, "r") as f:
-        data = json.load(f)
-    
-    # Create training examples
+    # Stream training data line by line; only the examples are kept in memory.
+    # Examples are (query, positive, hard negative) triplets: MultipleNegativesRankingLoss
+    # scores each query against its own hard negative on top of the in-batch negatives.
+    loads = orjson.loads if orjson is not None else json.loads
     train_examples = []
-    for query_id, query in data["queries"].items():
-        pos_id = data["relevant_docs"][query_id][0]
-        positive = data["corpus"][pos_id]
-        train_examples.append(InputExample(texts=[query, positive]))
+    use_negatives = True
+    with open(data_path, "rb") as f:
+        for line in f:
+            if not line.strip():
+                continue
+            record = loads(line)
+            texts = [record["query"], record["positive"]]
+            if record.get("hard_negative"):
+                texts.append(record["hard_negative"])
+            else:
+                use_negatives = False
+            train_examples.append(InputExample(texts=texts))
     
-    print(f"✓ Loaded {len(train_examples)} training examples")
+    # All examples in a batch need the same number of texts
+    if not use_negatives:
+        for example in train_examples:
+            example.texts = example.texts[:2]
+    
+    print(f"✓ Loaded {len(train_examples)} training examples"
+          f"{' with hard negatives' if use_negatives else ''}")
     
     # Load base model
     model_name = "sentence-transformers/all-MiniLM-L6-v2"
     print(f"✓ Loading base model: {model_name}")
     model = SentenceTransformer(model_name)
     
-    # Create dataloader
-    train_dataloader = DataLoader(train_examples, shuffle=True, batch_size=8)
+    # Create dataloader - MultipleNegativesRankingLoss uses the rest of the batch as
+    # negatives, so take as large a batch as the data allows (capped for memory)
+    batch_size = min(len(train_examples), 64)
+    # On GPU, tokenize batches in worker processes (kept alive across epochs) and
+    # collate into pinned memory so host-to-device copies are faster
+    use_cuda = torch.cuda.is_available()
+    loader_kwargs = {}
+    if use_cuda:
+        loader_kwargs = {"num_workers": 2, "pin_memory": True, "persistent_workers": True}
+    train_dataloader = DataLoader(
+        train_examples,
+        shuffle=True,
+        batch_size=batch_size,
+        collate_fn=model.smart_batching_collate,
+        **loader_kwargs
+    )
     
     # Loss function
     train_loss = losses.MultipleNegativesRankingLoss(model)
@@ -164,11 +190,15 @@ def fine_tune_embeddings():
     num_epochs = 3
     warmup_steps = int(len(train_dataloader) * num_epochs * 0.1)
     output_path = "models/drivesmart-embeddings"
+    # Mixed precision needs a CUDA device; on CPU training stays in fp32
+    use_amp = use_cuda
     
     print(f"\nTraining Configuration:")
     print(f"  • Epochs: {num_epochs}")
-    print(f"  • Batch size: 8")
+    print(f"  • Batch size: {batch_size}")
     print(f"  • Warmup steps: {warmup_steps}")
+    print(f"  • Mixed precision: {use_amp}")
+    print(f"  • DataLoader workers: {loader_kwargs.get('num_workers', 0)}")
     print(f"  • Output: {output_path}")
     
     # Create output directory
@@ -181,6 +211,7 @@ def fine_tune_embeddings():
         epochs=num_epochs,
         warmup_steps=warmup_steps,
         output_path=output_path,
+        use_amp=use_amp,
         show_progress_bar=True
     )
     
@@ -190,25 +221,79 @@ def fine_tune_embeddings():
     return model
 
 
+# =============================================================================
+# EMBEDDING CACHE
+# =============================================================================
+
+EMBEDDING_CACHE_DIR = Path("data/emb_cache")
+
+
+def _model_cache_tag(model_name):
+    """Identify a model version - local checkpoints change when they are re-trained"""
+    if os.path.isdir(model_name):
+        newest = max((entry.stat().st_mtime_ns for entry in os.scandir(model_name)), default=0)
+        return f"{model_name}@{newest}"
+    return model_name
+
+
+def _embedding_cache_path(model_tag, text, precision="fp32"):
+    digest = hashlib.sha256(f"{model_tag}\x00{text}\x00norm\x00{precision}".encode("utf-8")).hexdigest()
+    return EMBEDDING_CACHE_DIR / digest[:2] / f"{digest}.npy"
+
+
+def cached_encode(model, model_name, texts, batch_size=32, precision="fp32"):
+    """Encode texts to unit-length embeddings, reusing vectors saved by earlier runs"""
+    import numpy as np
+    
+    model_tag = _model_cache_tag(model_name)
+    paths = [_embedding_cache_path(model_tag, text, precision) for text in texts]
+    embeddings = [np.load(path) if path.exists() else None for path in paths]
+    
+    # Encode only the cache misses, in one batch
+    missing = [i for i, emb in enumerate(embeddings) if emb is None]
+    if missing:
+        encoded = model.encode(
+            [texts[i] for i in missing],
+            batch_size=batch_size,
+            normalize_embeddings=True,
+            convert_to_numpy=True
+        )
+        for i, emb in zip(missing, encoded):
+            paths[i].parent.mkdir(parents=True, exist_ok=True)
+            np.save(paths[i], emb)
+            embeddings[i] = emb
+    
+    return np.stack(embeddings)
+
+
 def test_model():
     """Quick test of the fine-tuned model"""
     from sentence_transformers import SentenceTransformer
     import numpy as np
+    import torch
     
     print("\n" + "=" * 60)
     print("TESTING FINE-TUNED MODEL")
     print("=" * 60)
     
-    # Load models
-    baseline = SentenceTransformer("sentence-transformers/all-MiniLM-L6-v2")
+    # Load models (fp16 inference on GPU)
+    device = "cuda" if torch.cuda.is_available() else "cpu"
+    precision = "fp16" if device == "cuda" else "fp32"
+    
+    baseline_name = "sentence-transformers/all-MiniLM-L6-v2"
+    baseline = SentenceTransformer(baseline_name, device=device)
     
     finetuned_path = "models/drivesmart-embeddings"
     if os.path.exists(finetuned_path):
-        finetuned = SentenceTransformer(finetuned_path)
+        finetuned = SentenceTransformer(finetuned_path, device=device)
     else:
         print("⚠ Fine-tuned model not found. Run fine-tuning first.")
         return
     
+    if precision == "fp16":
+        baseline.half()
+        finetuned.half()
+    
     # Test case
     query = "Can I use my phone while stopped at a traffic light?"
     relevant = "CVC 23123.5 prohibits handheld phone use while driving, including at red lights."
@@ -218,19 +303,35 @@ def test_model():
     print(f"Relevant: {relevant[:60]}...")
     print(f"Irrelevant: {irrelevant[:60]}...")
     
-    for name, model in [("Baseline", baseline), ("Fine-tuned", finetuned)]:
-        q_emb = model.encode(query)
-        r_emb = model.encode(relevant)
-        i_emb = model.encode(irrelevant)
+    # Also rank every training pair: positive vs hard negative for each query
+    queries = [pair["query"] for pair in RETRIEVAL_TRAINING_PAIRS]
+    positives = [pair["positive"] for pair in RETRIEVAL_TRAINING_PAIRS]
+    negatives = [pair["hard_negative"] for pair in RETRIEVAL_TRAINING_PAIRS]
+    texts = [query, relevant, irrelevant] + queries + positives + negatives
+    n = len(RETRIEVAL_TRAINING_PAIRS)
+    
+    for name, model, model_name in [
+        ("Baseline", baseline, baseline_name),
+        ("Fine-tuned", finetuned, finetuned_path),
+    ]:
+        # Cached or one batched forward pass; unit-length embeddings make cosine a plain dot product
+        embs = cached_encode(model, model_name, texts, precision=precision)
+        Q, P, N = embs[3:3 + n], embs[3 + n:3 + 2 * n], embs[3 + 2 * n:]
+        
+        # Both spot-check similarities from one matrix-vector product
+        rel_score, irr_score = (embs[1:3] @ embs[0]).tolist()
         
-        rel_score = np.dot(q_emb, r_emb) / (np.linalg.norm(q_emb) * np.linalg.norm(r_emb))
-        irr_score = np.dot(q_emb, i_emb) / (np.linalg.norm(q_emb) * np.linalg.norm(i_emb))
+        # Rows are aligned, so a row-wise dot product gives each query's two similarities
+        rel = np.einsum("ij,ij->i", Q, P)
+        irr = np.einsum("ij,ij->i", Q, N)
         
         correct = "✅" if rel_score > irr_score else "❌"
         print(f"\n{name}:")
         print(f"  Relevant similarity: {rel_score:.4f}")
         print(f"  Irrelevant similarity: {irr_score:.4f}")
         print(f"  Correct ranking: {correct}")
+        print(f"  Training pairs ranked correctly: {float((rel > irr).mean()):.1%} ({n} pairs)")
+        print(f"  Mean positive-negative margin: {float((rel - irr).mean()):.4f}")
 
 
 if __name__ == "__main__":
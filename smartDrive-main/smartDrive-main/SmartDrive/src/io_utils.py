@@ -0,0 +1,38 @@
+"""
+DriveSmart AI - JSON Output Helpers
+Shared JSON / JSON Lines writers for the evaluation and training scripts
+"""
+
+import json
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+def json_line(record):
+    """Serialize one record as a newline-terminated JSON line (bytes)"""
+    if orjson is not None:
+        return orjson.dumps(record) + b"\n"
+    return json.dumps(record, separators=(",", ":"), ensure_ascii=False).encode("utf-8") + b"\n"
+
+
+def save_report(report, path):
+    """Write a report as indented JSON, using orjson's C encoder when it is installed"""
+    if orjson is not None:
+        with open(path, "wb") as f:
+            f.write(orjson.dumps(report, option=orjson.OPT_INDENT_2))
+    else:
+        with open(path, "w") as f:
+            json.dump(report, f, indent=2)
+
+
+def write_jsonl(records, path):
+    """Write records as JSON Lines one at a time (records may be a generator); returns the count"""
+    count = 0
+    with open(path, "wb") as f:
+        for record in records:
+            f.write(json_line(record))
+            count += 1
+    return count
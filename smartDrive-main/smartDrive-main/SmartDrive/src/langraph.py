@@ -4,9 +4,15 @@ Advanced workflow with state management and feedback loops
 Save as: langgraph_implementation.py
 """
 
+import asyncio
 import os
+import threading
+from collections import OrderedDict
+from contextlib import AsyncExitStack
+from dataclasses import dataclass, field
+from functools import lru_cache
 from pathlib import Path
-from typing import TypedDict, List
+from typing import List
 from dotenv import load_dotenv
 
 # Load environment variables ONCE with override
@@ -17,29 +23,33 @@ load_dotenv(env_path, override=True)
 from langgraph.graph import StateGraph, END
 from langgraph.checkpoint.memory import MemorySaver
 
-# LangChain imports
-from langchain_openai import ChatOpenAI, OpenAIEmbeddings
+# LangChain imports (OpenAI/Chroma clients are imported in initialize_components)
 from langchain_core.prompts import PromptTemplate
 from langchain_core.output_parsers import StrOutputParser
-from langchain_chroma import Chroma
-import chromadb
+from langchain_core.documents import Document
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
 
 # ============================================================================
 # DEFINE STATE FOR LANGGRAPH
 # ============================================================================
 
-class TrafficQueryState(TypedDict):
-    """State that flows through the LangGraph"""
+@dataclass(slots=True)
+class TrafficQueryState:
+    """State that flows through the LangGraph (slots: fixed fields, attribute access)"""
     query: str
-    jurisdiction: str
-    retrieved_docs: List
-    analysis: str
-    answer: str
-    confidence: float
-    needs_clarification: bool
-    iteration_count: int
+    jurisdiction: str = "Massachusetts"
+    retrieved_docs: List = field(default_factory=list)
+    analysis: str = ""
+    answer: str = ""
+    confidence: float = 0.0
+    needs_clarification: bool = False
+    iteration_count: int = 0
 
-    query_type: str
+    query_type: str = ""
 
 # ============================================================================
 # INITIALIZE COMPONENTS
@@ -48,6 +58,11 @@ class TrafficQueryState(TypedDict):
 def initialize_components():
     """Initialize all components with proper error handling"""
     
+    # Provider clients are heavy to import; only pay for them when connecting
+    from langchain_openai import ChatOpenAI, OpenAIEmbeddings
+    from langchain_chroma import Chroma
+    import chromadb
+    
     # Get API key with strip
     api_key = os.getenv("OPENAI_API_KEY", "").strip()
     
@@ -85,6 +100,82 @@ def initialize_components():
     print("✓ All components initialized successfully")
     
     return llm, vectorstore
+
+class LocalVectorIndex:
+    """In-memory inner-product index over the whole (small) corpus
+    
+    Rows are L2-normalized, so one matrix-vector product ranks every document by
+    cosine similarity without a Chroma round trip per query. encoder is the local
+    sentence-transformers model that produced the rows, or None for the stored
+    OpenAI embeddings; queries must be embedded by the same model.
+    """
+    
+    def __init__(self, vectors, texts: List[str], metadatas: List[dict], encoder=None):
+        matrix = np.asarray(vectors, dtype=np.float32)
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        self.matrix = matrix / np.maximum(norms, 1e-12)
+        self.texts = texts
+        self.metadatas = metadatas
+        self.encoder = encoder
+    
+    def __len__(self):
+        return len(self.texts)
+    
+    def search(self, query_embedding, k: int) -> List[Document]:
+        k = min(k, len(self.texts))
+        if k <= 0:
+            return []
+        
+        query = np.asarray(query_embedding, dtype=np.float32)
+        scores = self.matrix @ (query / max(float(np.linalg.norm(query)), 1e-12))
+        
+        # Partial selection of the top k, then order just those
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        
+        return [Document(page_content=self.texts[i], metadata=self.metadatas[i] or {}) for i in top]
+
+def load_local_encoder():
+    """Fine-tuned sentence-transformers model, if it has been trained and the package is installed"""
+    model_path = os.getenv("DRIVESMART_EMBEDDING_MODEL", "models/drivesmart-embeddings")
+    if not os.path.isdir(model_path):
+        return None
+    
+    try:
+        from sentence_transformers import SentenceTransformer
+    except ImportError:
+        return None
+    
+    print(f"✓ Using local embedding model: {model_path}")
+    return SentenceTransformer(model_path)
+
+def build_local_index(vectorstore, encoder=None, page_size: int = 1000) -> LocalVectorIndex:
+    """Pull the corpus from the Chroma collection once
+    
+    Without an encoder the stored OpenAI embeddings are reused; with one, the
+    documents are re-embedded locally in batches.
+    """
+    collection = vectorstore._collection
+    include = ["documents", "metadatas"] if encoder is not None else ["embeddings", "documents", "metadatas"]
+    vectors, texts, metadatas = [], [], []
+    offset = 0
+    
+    while True:
+        page = collection.get(include=include, limit=page_size, offset=offset)
+        if encoder is None:
+            vectors.extend(page["embeddings"])
+        texts.extend(page["documents"])
+        metadatas.extend(page["metadatas"])
+        
+        if len(page["ids"]) < page_size:
+            break
+        offset += page_size
+    
+    if encoder is not None and texts:
+        vectors = encoder.encode(texts, batch_size=64, normalize_embeddings=True, convert_to_numpy=True)
+    
+    return LocalVectorIndex(vectors, texts, metadatas, encoder)
+
 TRAFFIC_SCOPE_HINTS = [
     "traffic", "drive", "driving", "road", "highway", "vehicle", "car",
     "license", "speed", "dui", "parking", "ticket", "fine",
@@ -92,103 +183,178 @@ TRAFFIC_SCOPE_HINTS = [
 ]
 
 def classify_query_type(state: TrafficQueryState) -> TrafficQueryState:
-    query_lower = state["query"].lower()
+    query_lower = state.query.lower()
 
     if not any(k in query_lower for k in TRAFFIC_SCOPE_HINTS):
-        state["query_type"] = "out_of_scope"
+        state.query_type = "out_of_scope"
         return state
 
     # You can keep this simple in Part 2
-    state["query_type"] = "in_scope"
+    state.query_type = "in_scope"
     return state
 
 
 def answer_out_of_scope(state: TrafficQueryState) -> TrafficQueryState:
-    state["answer"] = (
+    state.answer = (
         "I’m DriveSmart AI — a traffic-law assistant. "
         "I provide guidance on traffic rules, penalties, and safe driving across supported states. "
         "Your question looks outside my scope. "
         "Please ask me something related to traffic laws or safe driving in a supported state."
     )
     # Keep these stable
-    state["confidence"] = 1.0
-    state["needs_clarification"] = False
+    state.confidence = 1.0
+    state.needs_clarification = False
     return state
 # ============================================================================
 # LANGGRAPH NODE FUNCTIONS
 # ============================================================================
 
-# Initialize components globally
-llm, vectorstore = initialize_components()
+@dataclass(frozen=True)
+class Components:
+    """Connected runtime components shared by the graph nodes"""
+    llm: object
+    vectorstore: object
+    local_index: object       # LocalVectorIndex, or None to search Chroma per query
+    answer_chain: object
+
+@lru_cache(maxsize=1)
+def get_components() -> Components:
+    """Connect to OpenAI/Chroma on first use, so importing this module stays cheap"""
+    llm, vectorstore = initialize_components()
+    
+    # Local copy of the corpus embeddings; searches fall back to Chroma without it
+    local_index = None
+    if np is not None:
+        try:
+            local_index = build_local_index(vectorstore, load_local_encoder()) or None
+            if local_index is not None:
+                print(f"✓ Local vector index loaded ({len(local_index)} documents)")
+        except Exception as e:
+            print(f"⚠ Local vector index unavailable, searching Chroma per query: {e}")
+    
+    return Components(
+        llm=llm,
+        vectorstore=vectorstore,
+        local_index=local_index,
+        answer_chain=ANSWER_PROMPT | llm | StrOutputParser()
+    )
 
-def retrieve_documents(state: TrafficQueryState) -> TrafficQueryState:
-    """Node 1: Retrieve relevant documents from ChromaDB"""
+async def _asimilarity_search(query: str, k: int) -> List:
+    components = get_components()
+    vectorstore, local_index = components.vectorstore, components.local_index
+    if local_index is None:
+        return await vectorstore.asimilarity_search(query, k=k)
     
-    query = state["query"]
-    jurisdiction = state.get("jurisdiction", "Massachusetts")
+    if local_index.encoder is not None:
+        # Local forward pass is CPU/GPU bound; keep it off the event loop
+        query_embedding = await asyncio.to_thread(local_index.encoder.encode, query, normalize_embeddings=True)
+    else:
+        query_embedding = await vectorstore.embeddings.aembed_query(query)
+    return local_index.search(query_embedding, k)
+
+# LRU cache of retrieval results, keyed by (case/whitespace-normalized query, k).
+# A hit skips both the query-embedding API call and the search itself.
+SEARCH_CACHE_SIZE = 512
+_search_cache = OrderedDict()
+_search_cache_lock = threading.Lock()
+
+def _search_cache_key(query: str, k: int) -> tuple:
+    return (" ".join(query.lower().split()), k)
+
+def _search_cache_get(key: tuple):
+    with _search_cache_lock:
+        docs = _search_cache.get(key)
+        if docs is not None:
+            _search_cache.move_to_end(key)
+        return docs
+
+def _search_cache_put(key: tuple, docs: tuple):
+    with _search_cache_lock:
+        _search_cache[key] = docs
+        if len(_search_cache) > SEARCH_CACHE_SIZE:
+            _search_cache.popitem(last=False)
+
+async def acached_similarity_search(query: str, k: int = 3) -> List:
+    """vectorstore.asimilarity_search memoized per normalized query"""
+    key = _search_cache_key(query, k)
+    docs = _search_cache_get(key)
+    if docs is None:
+        # Search outside the lock so concurrent misses don't serialize on network I/O
+        docs = tuple(await _asimilarity_search(query, k))
+        _search_cache_put(key, docs)
+    return list(docs)
+
+# Prompt and chain are stateless, so build them once instead of per generate_answer call
+# (the chain is assembled in get_components once the LLM exists)
+ANSWER_PROMPT = PromptTemplate(
+    input_variables=["context", "question"],
+    template="""You are a traffic law expert. Use the following context to answer the question accurately.
+
+Context:
+{context}
+
+Question: {question}
+
+Provide a clear, accurate answer with:
+1. Direct answer
+2. Legal statute reference
+3. Penalties (if applicable)
+4. Prevention tips
+
+Answer:"""
+)
+CLARIFICATION_TEMPLATE = """I found limited information about your query: "{query}"
+
+Could you please provide more details such as:
+- Specific jurisdiction (state/city)?
+- Exact scenario or violation type?
+- Any additional context?
+
+This will help me provide a more accurate answer."""
+
+# (confidence, needs_clarification) by number of retrieved docs; 2+ docs is confident
+CONFIDENCE_BY_DOC_COUNT = {0: (0.2, True), 1: (0.5, True)}
+HIGH_CONFIDENCE = (0.8, False)
+
+async def retrieve_documents(state: TrafficQueryState) -> TrafficQueryState:
+    """Node 1: Retrieve relevant documents from ChromaDB and score confidence"""
+    
+    query = state.query
+    jurisdiction = state.jurisdiction
     
     # Search (without filter for now, as it may cause issues)
-    docs = vectorstore.similarity_search(query, k=3)
+    docs = await acached_similarity_search(query, k=3)
     
-    state["retrieved_docs"] = docs
+    state.retrieved_docs = docs
+    
+    # Calculate confidence based on number of docs here, so confident results can
+    # go straight to generate without an extra analyze step (and checkpoint write)
+    state.confidence, state.needs_clarification = CONFIDENCE_BY_DOC_COUNT.get(len(docs), HIGH_CONFIDENCE)
     
     print(f"[RETRIEVE] Found {len(docs)} documents")
     
     return state
 
 def analyze_confidence(state: TrafficQueryState) -> TrafficQueryState:
-    """Node 2: Analyze confidence of retrieved documents"""
-    
-    docs = state["retrieved_docs"]
-    
-    # Calculate confidence based on number of docs
-    if len(docs) >= 2:
-        state["confidence"] = 0.8
-        state["needs_clarification"] = False
-    elif len(docs) == 1:
-        state["confidence"] = 0.5
-        state["needs_clarification"] = True
-    else:
-        state["confidence"] = 0.2
-        state["needs_clarification"] = True
+    """Node 2: Report low confidence (scored in retrieve) before deciding to refine or clarify"""
     
-    print(f"[ANALYZE] Confidence: {state['confidence']:.2f}")
+    print(f"[ANALYZE] Confidence: {state.confidence:.2f}")
     
     return state
 
-def generate_answer(state: TrafficQueryState) -> TrafficQueryState:
-    """Node 3: Generate answer using LLM"""
+async def generate_answer(state: TrafficQueryState) -> TrafficQueryState:
+    """Node 3: Generate answer using LLM (async, so the event loop is free while GPT-4o runs)"""
     
-    docs = state["retrieved_docs"]
-    query = state["query"]
+    docs = state.retrieved_docs
+    query = state.query
     
     # Format documents
     context = "\n\n".join([doc.page_content for doc in docs])
     
-    # Create prompt
-    prompt = PromptTemplate(
-        input_variables=["context", "question"],
-        template="""You are a traffic law expert. Use the following context to answer the question accurately.
-
-Context:
-{context}
-
-Question: {question}
-
-Provide a clear, accurate answer with:
-1. Direct answer
-2. Legal statute reference
-3. Penalties (if applicable)
-4. Prevention tips
-
-Answer:"""
-    )
-    
     # Generate answer
-    chain = prompt | llm | StrOutputParser()
-    answer = chain.invoke({"context": context, "question": query})
+    answer = await get_components().answer_chain.ainvoke({"context": context, "question": query})
     
-    state["answer"] = answer
+    state.answer = answer
     
     print(f"[GENERATE] Answer generated ({len(answer)} chars)")
     
@@ -197,28 +363,29 @@ Answer:"""
 def request_clarification(state: TrafficQueryState) -> TrafficQueryState:
     """Node 4: Request clarification if confidence is low"""
     
-    state["answer"] = f"""I found limited information about your query: "{state['query']}"
-
-Could you please provide more details such as:
-- Specific jurisdiction (state/city)?
-- Exact scenario or violation type?
-- Any additional context?
-
-This will help me provide a more accurate answer."""
+    state.answer = CLARIFICATION_TEMPLATE.format(query=state.query)
     
     print("[CLARIFY] Requesting more information")
     
     return state
 
+REFINE_SUFFIX = "traffic violation law penalty"
+REFINE_TERMS = frozenset(REFINE_SUFFIX.split())
+
 def refine_query(state: TrafficQueryState) -> TrafficQueryState:
     """Node 5: Refine query based on feedback (for cycles)"""
     
-    iteration = state.get("iteration_count", 0) + 1
-    state["iteration_count"] = iteration
+    iteration = state.iteration_count + 1
+    state.iteration_count = iteration
     
     # Expand query with synonyms or related terms
-    original_query = state["query"]
-    state["query"] = f"{original_query} traffic violation law penalty"
+    original_query = state.query
+    if REFINE_TERMS.issubset(original_query.lower().split()):
+        # Expansion adds no new terms, so keep the query; retrieve then hits the search cache
+        print(f"[REFINE] Iteration {iteration}, query already expanded")
+        return state
+    
+    state.query = f"{original_query} {REFINE_SUFFIX}"
     
     print(f"[REFINE] Iteration {iteration}, expanded query")
     
@@ -231,19 +398,29 @@ def refine_query(state: TrafficQueryState) -> TrafficQueryState:
 def should_clarify(state: TrafficQueryState) -> str:
     """Decide whether to clarify or generate answer"""
     
-    if state["needs_clarification"] and state.get("iteration_count", 0) == 0:
+    if state.needs_clarification and state.iteration_count == 0:
         return "refine"
-    elif state["needs_clarification"]:
+    elif state.needs_clarification:
         return "clarify"
     else:
         return "generate"
 
+def route_after_retrieve(state: TrafficQueryState) -> str:
+    """Skip analyze when retrieval is already confident"""
+    
+    return "analyze" if state.needs_clarification else "generate"
+
+def route_after_classify(state: TrafficQueryState) -> str:
+    """Send out-of-scope queries straight to the canned reply"""
+    
+    return "out_of_scope" if state.query_type == "out_of_scope" else "retrieve"
+
 def should_iterate(state: TrafficQueryState) -> str:
     """Decide whether to iterate or end"""
     
-    iteration = state.get("iteration_count", 0)
+    iteration = state.iteration_count
     
-    if iteration < 2 and state["confidence"] < 0.6:
+    if iteration < 2 and state.confidence < 0.6:
         return "retrieve"  # Try again with refined query
     else:
         return "end"
@@ -252,7 +429,20 @@ def should_iterate(state: TrafficQueryState) -> str:
 # BUILD LANGGRAPH
 # ============================================================================
 
-def build_traffic_law_graph():
+CHECKPOINT_DB = Path(__file__).parent / "data" / "lg_checkpoints.sqlite"
+
+async def open_checkpointer(stack: AsyncExitStack):
+    """SQLite-backed checkpointer (bounded memory, survives restarts), or MemorySaver if unavailable"""
+    try:
+        from langgraph.checkpoint.sqlite.aio import AsyncSqliteSaver
+    except ImportError:
+        print("⚠ langgraph-checkpoint-sqlite not installed - keeping checkpoints in memory")
+        return MemorySaver()
+    
+    CHECKPOINT_DB.parent.mkdir(exist_ok=True)
+    return await stack.enter_async_context(AsyncSqliteSaver.from_conn_string(str(CHECKPOINT_DB)))
+
+def build_traffic_law_graph(checkpointer=None):
     """Build the LangGraph workflow with feedback loops + out-of-scope guard"""
     
     workflow = StateGraph(TrafficQueryState)
@@ -283,8 +473,15 @@ def build_traffic_law_graph():
 
     workflow.add_edge("out_of_scope", END)
 
-    # normal flow
-    workflow.add_edge("retrieve", "analyze")
+    # normal flow - confident retrievals go straight to generate
+    workflow.add_conditional_edges(
+        "retrieve",
+        route_after_retrieve,
+        {
+            "generate": "generate",
+            "analyze": "analyze"
+        }
+    )
     
     workflow.add_conditional_edges(
         "analyze",
@@ -309,7 +506,7 @@ def build_traffic_law_graph():
     
     workflow.add_edge("clarify", END)
     
-    memory = MemorySaver()
+    memory = checkpointer if checkpointer is not None else MemorySaver()
     app = workflow.compile(checkpointer=memory)
     
     print("✓ LangGraph workflow compiled successfully")
@@ -319,15 +516,20 @@ def build_traffic_law_graph():
 # MAIN EXECUTION
 # ============================================================================
 
-def main():
+async def main():
     """Test the LangGraph workflow"""
     
     print("=" * 70)
     print("DriveSmart AI - LangGraph Implementation")
     print("=" * 70)
     
-    # Build graph
-    app = build_traffic_law_graph()
+    # Build graph; the SQLite checkpointer connection stays open for the whole run
+    async with AsyncExitStack() as stack:
+        app = build_traffic_law_graph(await open_checkpointer(stack))
+        await run_test_queries(app)
+
+async def run_test_queries(app):
+    """Stream the sample queries through the compiled graph"""
     
     # Test queries
     test_queries = [
@@ -351,29 +553,22 @@ def main():
         print(f"Jurisdiction: {test['jurisdiction']}")
         print(f"{'='*70}\n")
         
-        # Create initial state
-        initial_state = {
-            "query": test["query"],
-            "jurisdiction": test["jurisdiction"],
-            "retrieved_docs": [],
-            "analysis": "",
-            "answer": "",
-            "confidence": 0.0,
-            "needs_clarification": False,
-            "iteration_count": 0,
-            "query_type": ""   
-        }
+        # Create initial state (remaining fields take their defaults)
+        initial_state = TrafficQueryState(
+            query=test["query"],
+            jurisdiction=test["jurisdiction"]
+        )
         
         # Run graph
         config = {"configurable": {"thread_id": f"test_{i}"}}
         
-        for output in app.stream(initial_state, config):
+        async for output in app.astream(initial_state, config):
             # Print step output
-            node_name = list(output.keys())[0]
+            node_name = next(iter(output))
             print(f"Step: {node_name}")
         
-        # Get final state
-        final_state = output[node_name]
+        # Get final state (channel values as a dict) from the checkpointer
+        final_state = (await app.aget_state(config)).values
         
         print(f"\n{'='*70}")
         print("FINAL ANSWER:")
@@ -383,4 +578,4 @@ def main():
         print(f"\n{final_state['answer']}\n")
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    asyncio.run(main())
\ No newline at end of file
@@ -17,7 +17,7 @@ from langchain_openai import ChatOpenAI, OpenAIEmbeddings
 from langchain_chroma import Chroma
 from langchain_core.prompts import PromptTemplate
 from langchain_core.output_parsers import StrOutputParser
-from langchain_core.runnables import RunnableParallel, RunnablePassthrough
+from langchain_core.runnables import RunnableParallel, RunnablePassthrough, RunnableLambda
 import chromadb
 
 # ============================================================================
@@ -185,17 +185,23 @@ class RefinedDriveSmartWorkflow:
         """Format documents for context"""
         return "\n\n".join(doc.page_content for doc in docs)
     
+    def retrieve(self, question: str):
+        """Retrieve context documents (lets callers prefetch them before calling query)"""
+        return self.retriever.invoke(question)
+    
     def query_with_prompt(self, question: str, prompt_template: str, 
-                          input_var: str = "question"):
-        """Query using specific prompt template"""
+                          input_var: str = "question", docs=None):
+        """Query using specific prompt template (docs: already-retrieved context, if any)"""
         
         prompt = PromptTemplate(
             input_variables=["context", input_var],
             template=prompt_template
         )
         
+        context = self.retriever if docs is None else RunnableLambda(lambda _: docs)
+        
         chain = RunnableParallel({
-            "context": self.retriever,
+            "context": context,
             input_var: RunnablePassthrough()
         }).assign(
             answer=lambda x: (
@@ -215,10 +221,11 @@ class RefinedDriveSmartWorkflow:
             'answer': result['answer'],
             'sources': result['sources']
         }
-    def query(self, question: str, prompt_type_key: str = "general"):
+    def query(self, question: str, prompt_type_key: str = "general", docs=None):
         """
         Dashboard-friendly API.
         Routes to the right refined prompt and returns a consistent result shape.
+        Pass docs from retrieve() to skip the retrieval step.
         """
 
         key = (prompt_type_key or "general").lower().strip()
@@ -233,7 +240,7 @@ class RefinedDriveSmartWorkflow:
             prompt = REFINED_PROMPT_1
             input_var = "question"
 
-        result = self.query_with_prompt(question, prompt, input_var)
+        result = self.query_with_prompt(question, prompt, input_var, docs=docs)
 
         # Try to infer jurisdiction from retrieved metadata (if your docs have it)
         jurisdictions = set()
@@ -3,8 +3,18 @@ DriveSmart AI - Training Data Preparation
 Creates fine-tuning dataset from traffic law sources
 """
 
-import json
-from typing import List, Dict
+import hashlib
+import re
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from pathlib import Path
+from typing import List, Dict, Sequence
+
+from io_utils import write_jsonl
+
+# Citation / disclaimer checks for validate_training_data, one case-insensitive scan each
+_CITE_RE = re.compile(r"section|code|cvc|statute", re.IGNORECASE)
+_DISC_RE = re.compile(r"not legal advice|disclaimer", re.IGNORECASE)
 
 # =============================================================================
 # OPTION 1: Training data for EMBEDDING MODEL fine-tuning (Recommended)
@@ -42,34 +52,20 @@ RETRIEVAL_TRAINING_PAIRS = [
 ]
 
 
-def prepare_embedding_training_data(pairs: List[Dict]) -> Dict:
-    """Prepare data for sentence-transformers fine-tuning"""
-    
-    training_data = {
-        "queries": {},
-        "corpus": {},
-        "relevant_docs": {}
-    }
-    
-    for idx, pair in enumerate(pairs):
-        query_id = f"q{idx}"
-        pos_id = f"pos{idx}"
-        neg_id = f"neg{idx}"
-        
-        training_data["queries"][query_id] = pair["query"]
-        training_data["corpus"][pos_id] = pair["positive"]
-        training_data["corpus"][neg_id] = pair["hard_negative"]
-        training_data["relevant_docs"][query_id] = [pos_id]
-    
-    return training_data
-
-
 # =============================================================================
 # OPTION 2: Training data for LLM fine-tuning (if required by assignment)
 # Format for instruction fine-tuning
 # =============================================================================
 
-LLM_TRAINING_DATA = [
+@dataclass(slots=True, frozen=True)
+class TrainingExample:
+    """One instruction-tuning example"""
+    instruction: str
+    response: str
+    system: str = ""
+
+
+_LLM_TRAINING_RECORDS = [
     {
         "system": "You are DriveSmart AI, a certified traffic law instructor. Provide accurate, jurisdiction-specific traffic law information with legal citations. Always include a disclaimer that this is not legal advice.",
         "instruction": "Is it legal to use my phone at a red light in California?",
@@ -116,99 +112,145 @@ LLM_TRAINING_DATA = [
     # Add 100-500 more examples covering various scenarios
 ]
 
+LLM_TRAINING_DATA = tuple(TrainingExample(**record) for record in _LLM_TRAINING_RECORDS)
+
+
+def _to_alpaca(ex: TrainingExample) -> Dict:
+    return {
+        "instruction": ex.instruction,
+        "input": "",
+        "output": ex.response,
+        "system": ex.system
+    }
+
+
+def _to_sharegpt(ex: TrainingExample) -> Dict:
+    return {
+        "conversations": [
+            {"from": "system", "value": ex.system},
+            {"from": "human", "value": ex.instruction},
+            {"from": "gpt", "value": ex.response}
+        ]
+    }
+
 
-def prepare_llm_training_data(examples: List[Dict], format: str = "alpaca") -> List[Dict]:
+def _to_openai(ex: TrainingExample) -> Dict:
+    return {
+        "messages": [
+            {"role": "system", "content": ex.system},
+            {"role": "user", "content": ex.instruction},
+            {"role": "assistant", "content": ex.response}
+        ]
+    }
+
+
+_FORMATTERS = {"alpaca": _to_alpaca, "sharegpt": _to_sharegpt, "openai": _to_openai}
+
+
+def prepare_llm_training_data(examples: Sequence[TrainingExample], format: str = "alpaca") -> List[Dict]:
     """
     Prepare data for LLM fine-tuning in various formats
     Formats: alpaca, sharegpt, openai
     """
     
-    formatted_data = []
+    # Format is fixed per call, so pick the adapter once instead of per example
+    formatter = _FORMATTERS.get(format)
+    if formatter is None:
+        return []
+    
+    return [formatter(ex) for ex in examples]
+
+
+def format_llm_training_data(examples: Sequence[TrainingExample]) -> Dict[str, List[Dict]]:
+    """Build every format in _FORMATTERS in a single pass over the examples"""
+    
+    outputs = {fmt: [] for fmt in _FORMATTERS}
+    appenders = [(outputs[fmt].append, formatter) for fmt, formatter in _FORMATTERS.items()]
     
     for ex in examples:
-        if format == "alpaca":
-            formatted_data.append({
-                "instruction": ex["instruction"],
-                "input": "",
-                "output": ex["response"],
-                "system": ex.get("system", "")
-            })
-        
-        elif format == "sharegpt":
-            formatted_data.append({
-                "conversations": [
-                    {"from": "system", "value": ex.get("system", "")},
-                    {"from": "human", "value": ex["instruction"]},
-                    {"from": "gpt", "value": ex["response"]}
-                ]
-            })
-        
-        elif format == "openai":
-            formatted_data.append({
-                "messages": [
-                    {"role": "system", "content": ex.get("system", "")},
-                    {"role": "user", "content": ex["instruction"]},
-                    {"role": "assistant", "content": ex["response"]}
-                ]
-            })
+        for append, formatter in appenders:
+            append(formatter(ex))
     
-    return formatted_data
+    return outputs
 
 
-def validate_training_data(data: List[Dict]) -> Dict:
+def validate_training_data(data: Sequence[TrainingExample]) -> Dict:
     """Validate training data quality"""
     
     issues = []
-    stats = {
-        "total_examples": len(data),
-        "avg_response_length": 0,
-        "has_citations": 0,
-        "has_disclaimer": 0
-    }
+    count = len(data)
     
-    total_length = 0
+    # Single pass with local counters; the response length is computed once per example
+    total_length = has_citations = has_disclaimer = 0
     
     for idx, ex in enumerate(data):
-        response = ex.get("response", ex.get("output", ""))
-        total_length += len(response)
+        response = ex.response
+        length = len(response)
+        total_length += length
         
         # Check for citations
-        if any(term in response.lower() for term in ["section", "code", "cvc", "statute"]):
-            stats["has_citations"] += 1
+        if _CITE_RE.search(response):
+            has_citations += 1
         else:
             issues.append(f"Example {idx}: Missing legal citation")
         
         # Check for disclaimer
-        if "not legal advice" in response.lower() or "disclaimer" in response.lower():
-            stats["has_disclaimer"] += 1
+        if _DISC_RE.search(response):
+            has_disclaimer += 1
         else:
             issues.append(f"Example {idx}: Missing disclaimer")
         
         # Check response length
-        if len(response) < 200:
-            issues.append(f"Example {idx}: Response too short ({len(response)} chars)")
+        if length < 200:
+            issues.append(f"Example {idx}: Response too short ({length} chars)")
     
-    stats["avg_response_length"] = total_length / len(data) if data else 0
-    stats["citation_rate"] = stats["has_citations"] / len(data) if data else 0
-    stats["disclaimer_rate"] = stats["has_disclaimer"] / len(data) if data else 0
+    stats = {
+        "total_examples": count,
+        "avg_response_length": total_length / count if count else 0,
+        "has_citations": has_citations,
+        "has_disclaimer": has_disclaimer,
+        "citation_rate": has_citations / count if count else 0,
+        "disclaimer_rate": has_disclaimer / count if count else 0
+    }
     
     return {"stats": stats, "issues": issues[:20]}  # First 20 issues
 
 
+def _file_digest(path):
+    """blake2b digest of a file's bytes"""
+    return hashlib.blake2b(Path(path).read_bytes(), digest_size=16).hexdigest()
+
+
 def save_training_data():
     """Save training data in multiple formats"""
     
-    # Save embedding training data
-    embedding_data = prepare_embedding_training_data(RETRIEVAL_TRAINING_PAIRS)
-    with open("data/embedding_training_data.json", "w") as f:
-        json.dump(embedding_data, f, indent=2)
-    print(f"Saved {len(RETRIEVAL_TRAINING_PAIRS)} embedding training pairs")
+    # Save embedding training data as JSON Lines (the format fine_tune_embeddings streams),
+    # skipping the rewrite when the source pairs are unchanged since the last run and the
+    # file is still the one written then (fine-tuning-code.py writes to the same path)
+    embedding_path = Path("data/embedding_training_data.jsonl")
+    hash_path = embedding_path.with_name(embedding_path.name + ".hash")
+    src_hash = hashlib.blake2b(repr(RETRIEVAL_TRAINING_PAIRS).encode(), digest_size=16).hexdigest()
+    if (embedding_path.exists() and hash_path.exists()
+            and hash_path.read_text() == f"{src_hash} {_file_digest(embedding_path)}"):
+        print(f"Embedding training pairs unchanged, kept {embedding_path}")
+    else:
+        count = write_jsonl(
+            ({"query": p["query"], "positive": p["positive"], "hard_negative": p["hard_negative"]}
+             for p in RETRIEVAL_TRAINING_PAIRS),
+            embedding_path
+        )
+        hash_path.write_text(f"{src_hash} {_file_digest(embedding_path)}")
+        print(f"Saved {count} embedding training pairs")
     
-    # Save LLM training data in different formats
-    for fmt in ["alpaca", "sharegpt", "openai"]:
-        formatted = prepare_llm_training_data(LLM_TRAINING_DATA, format=fmt)
-        with open(f"data/llm_training_{fmt}.json", "w") as f:
-            json.dump(formatted, f, indent=2)
+    # Save LLM training data in different formats as JSON Lines, so trainers can
+    # stream them; the three files are written concurrently (file writes release the GIL)
+    formats = format_llm_training_data(LLM_TRAINING_DATA)
+    with ThreadPoolExecutor(max_workers=len(formats)) as executor:
+        list(executor.map(
+            write_jsonl,
+            formats.values(),
+            [f"data/llm_training_{fmt}.jsonl" for fmt in formats]
+        ))
     print(f"Saved {len(LLM_TRAINING_DATA)} LLM training examples in 3 formats")
     
     # Validate
@@ -10,8 +10,6 @@ Data location: smartdrive/data/traffic_laws_dataset.json
 
 import os
 import json
-import pandas as pd 
- # Add pandas for CSV reading
 import re
 from typing import List
 from pathlib import Path
@@ -177,6 +175,8 @@ Keywords: {', '.join(item['keywords'])}
             metadata = {
                 'id': item['id'],
                 'jurisdiction': item['jurisdiction'],
+                # normalized once at ingest so lookups don't re-strip/lower per result
+                'jurisdiction_norm': item['jurisdiction'].strip().lower(),
                 'category': item['category'],
                 'violation': item['violation'],
                 'statute': item['statute'],
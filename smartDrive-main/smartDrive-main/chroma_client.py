@@ -0,0 +1,29 @@
+# chroma_client.py
+import asyncio
+import chromadb
+from config import creds
+
+# One Chroma Cloud client per process, so probes share its connection pool
+# instead of each paying a fresh TCP + TLS handshake
+_client = None
+_client_lock = asyncio.Lock()
+
+
+async def get_client():
+    """Return the shared AsyncHttpClient, creating it on first use"""
+    global _client
+    async with _client_lock:
+        if _client is None:
+            api_key, tenant, database = creds()
+            _client = await chromadb.AsyncHttpClient(
+                host="api.trychroma.com",
+                port=443,
+                ssl=True,
+                # Chroma Cloud authenticates with X-Chroma-Token (as chromadb's CloudClient does)
+                headers={
+                    "X-Chroma-Token": api_key
+                },
+                tenant=tenant,
+                database=database
+            )
+    return _client
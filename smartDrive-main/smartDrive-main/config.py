@@ -0,0 +1,17 @@
+# config.py
+import os
+from functools import lru_cache
+from dotenv import load_dotenv
+
+# Everything creds() reads; CI injects these as env vars
+CRED_KEYS = ('CHROMA_API_KEY', 'CHROMA_TENANT', 'CHROMA_DB')
+
+# Only read and parse .env when one of them is missing
+if not all(os.getenv(k) for k in CRED_KEYS):
+    load_dotenv(override=False)
+
+
+@lru_cache(maxsize=1)
+def creds():
+    """Chroma Cloud (api_key, tenant, database), read from the environment once"""
+    return tuple(os.getenv(k) for k in CRED_KEYS)
@@ -10,13 +10,14 @@ import os
 import sys
 from pathlib import Path
 import sqlite3
+import threading
 from dotenv import load_dotenv
-import uuid
 import inspect
 import re
 import html
 import json
 import base64
+from concurrent.futures import ThreadPoolExecutor
 
 def img_to_base64(path: str) -> str:
     with open(path, "rb") as f:
@@ -111,7 +112,7 @@ def build_out_of_scope_answer(supported_states):
     return OUT_OF_SCOPE_MESSAGE
 # -------------------- SESSION STATE (ONLY ONCE) --------------------
 if "session_id" not in st.session_state:
-    st.session_state.session_id = str(uuid.uuid4())
+    st.session_state.session_id = os.urandom(16).hex()
 
 if "processing" not in st.session_state:
     st.session_state.processing = False
@@ -232,6 +233,22 @@ if "messages_migrated_v3" not in st.session_state:
     normalize_messages_once()
     st.session_state.messages_migrated_v3 = True
 # -------------------- DATABASE MANAGER --------------------
+INSERT_QUERY_SQL = '''
+    INSERT INTO query_history 
+    (query, response, jurisdiction, analysis_type, response_time, sources_count)
+    VALUES (?, ?, ?, ?, ?, ?)
+'''
+
+def _query_row(query_data):
+    return (
+        query_data.get('query', ''),
+        (query_data.get('response', '') or '')[:1000],
+        query_data.get('jurisdiction', 'All'),
+        query_data.get('analysis_type', 'general'),
+        float(query_data.get('response_time', 0.0)),
+        int(query_data.get('sources_count', 0))
+    )
+
 class DatabaseManager:
     def __init__(self):
         # ---- Chroma Cloud collection ----
@@ -239,25 +256,11 @@ class DatabaseManager:
         self.traffic_collection = None
 
         try:
-            from chromadb import HttpClient
-            from chromadb.utils import embedding_functions
+            # Shared process-wide client + embedding function (also used by scripts)
+            from db_connection import get_chroma_client, get_embedding_function
 
-            self.embedding_function = embedding_functions.OpenAIEmbeddingFunction(
-                api_key=os.getenv('OPENAI_API_KEY'),
-                model_name="text-embedding-3-small"
-            )
-
-            self.chroma_client = HttpClient(
-                host="api.trychroma.com",
-                port=443,
-                ssl=True,
-                headers={
-                    "Authorization": f"Bearer {os.getenv('CHROMA_API_KEY')}",
-                    "X-Chroma-Token": os.getenv('CHROMA_API_KEY')
-                },
-                tenant=os.getenv('CHROMA_TENANT'),
-                database=os.getenv('CHROMA_DB')
-            )
+            self.embedding_function = get_embedding_function()
+            self.chroma_client = get_chroma_client()
 
             self.traffic_collection = self.chroma_client.get_collection(
                 "traffic_laws",
@@ -268,7 +271,15 @@ class DatabaseManager:
             self.db_connected = False
 
         # ---- SQLite for analytics ----
+        # One connection shared by every thread (Streamlit runs each rerun on a new one),
+        # so it is opened and configured once; all use is serialized by _lock
+        self._lock = threading.Lock()
         self.sqlite_conn = sqlite3.connect('drivesmart_analytics.db', check_same_thread=False)
+        self.sqlite_conn.row_factory = sqlite3.Row
+        # WAL + NORMAL sync: commits append to the log without an fsync each time
+        self.sqlite_conn.execute("PRAGMA journal_mode=WAL")
+        self.sqlite_conn.execute("PRAGMA synchronous=NORMAL")
+        self.sqlite_conn.execute("PRAGMA temp_store=MEMORY")
         self._init_sqlite_tables()
 
     def _init_sqlite_tables(self):
@@ -285,38 +296,37 @@ class DatabaseManager:
                 timestamp DATETIME DEFAULT CURRENT_TIMESTAMP
             )
         ''')
+        # get_stats' "today" filter is a range scan on this index
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_qh_ts ON query_history(timestamp)')
         self.sqlite_conn.commit()
 
     def save_query(self, query_data):
-        cursor = self.sqlite_conn.cursor()
-        cursor.execute('''
-            INSERT INTO query_history 
-            (query, response, jurisdiction, analysis_type, response_time, sources_count)
-            VALUES (?, ?, ?, ?, ?, ?)
-        ''', (
-            query_data.get('query', ''),
-            (query_data.get('response', '') or '')[:1000],
-            query_data.get('jurisdiction', 'All'),
-            query_data.get('analysis_type', 'general'),
-            float(query_data.get('response_time', 0.0)),
-            int(query_data.get('sources_count', 0))
-        ))
-        self.sqlite_conn.commit()
+        with self._lock, self.sqlite_conn as conn:
+            cursor = conn.execute(INSERT_QUERY_SQL, _query_row(query_data))
+        _cached_stats.clear()
         return cursor.lastrowid
 
-    def get_stats(self):
-        cursor = self.sqlite_conn.cursor()
+    def save_queries(self, queries):
+        """Save a batch of queries in one transaction (one commit for the whole batch)"""
+        rows = [_query_row(q) for q in queries]
+        with self._lock, self.sqlite_conn as conn:
+            cursor = conn.executemany(INSERT_QUERY_SQL, rows)
+        _cached_stats.clear()
+        return cursor.rowcount
 
-        today_stats = cursor.execute('''
-            SELECT COUNT(*) as queries_today, AVG(response_time) as avg_response_time
-            FROM query_history
-            WHERE DATE(timestamp) = DATE('now', 'localtime')
-        ''').fetchone()
-
-        total_stats = cursor.execute('''
-            SELECT COUNT(*) as total_queries
-            FROM query_history
-        ''').fetchone()
+    def get_stats(self):
+        # Served from a short-lived cache so widget reruns don't hit SQLite + Chroma Cloud
+        return _cached_stats(self)
+
+    def _query_stats(self):
+        # Aggregates always return exactly one row
+        with self._lock:
+            row = self.sqlite_conn.execute('''
+                SELECT COUNT(*) as queries_today, AVG(response_time) as avg_response_time,
+                       (SELECT COUNT(*) FROM query_history) as total_queries
+                FROM query_history
+                WHERE timestamp >= DATE('now', 'localtime') AND timestamp < DATE('now', 'localtime', '+1 day')
+            ''').fetchone()
 
         laws_count = 24
         if self.db_connected and self.traffic_collection:
@@ -326,9 +336,9 @@ class DatabaseManager:
                 pass
 
         return {
-            'queries_today': today_stats[0] if today_stats else 0,
-            'avg_response_time': today_stats[1] if today_stats and today_stats[1] else 2.1,
-            'total_queries': total_stats[0] if total_stats else 0,
+            'queries_today': row['queries_today'],
+            'avg_response_time': row['avg_response_time'] or 2.1,
+            'total_queries': row['total_queries'],
             'laws_indexed': laws_count
         }
 
@@ -360,6 +370,11 @@ class DatabaseManager:
             return fallback
 
 # -------------------- CACHED RESOURCES --------------------
+@st.cache_data(ttl=10, show_spinner=False)
+def _cached_stats(_db):
+    # _db is not hashed; there is a single DatabaseManager (see get_managers)
+    return _db._query_stats()
+
 @st.cache_resource
 def get_managers():
     db_manager = DatabaseManager()
@@ -377,6 +392,11 @@ def get_vectorstore():
     vsm = CloudTrafficLawVectorStore()
     return vsm.get_existing_vectorstore("traffic_laws")
 
+@st.cache_resource
+def get_prefetch_pool():
+    # Shared across reruns/sessions; a module-level pool would be recreated on every rerun
+    return ThreadPoolExecutor(max_workers=4, thread_name_prefix="retrieval-prefetch")
+
 @st.cache_resource
 def get_workflow():
     init_params = list(inspect.signature(RefinedDriveSmartWorkflow.__init__).parameters)
@@ -874,6 +894,11 @@ section[data-testid="stSidebar"] button[aria-label="🗑️ Clear Chat History"]
 
 
 # -------------------- SIDEBAR --------------------
+STAT_CARD_TMPL = (
+    '<div class="stat-card"><div class="stat-value">{value}</div>'
+    '<div class="stat-label">{label}</div></div>'
+)
+
 with st.sidebar:
  
     st.markdown("""
@@ -899,26 +924,15 @@ with st.sidebar:
 
     stats = db_manager.get_stats()
 
-    st.markdown(f"""
-    <div class="stat-card">
-        <div class="stat-value">{stats['queries_today']}</div>
-        <div class="stat-label">Queries Today</div>
-    </div>
-    """, unsafe_allow_html=True)
-
-    st.markdown(f"""
-    <div class="stat-card">
-        <div class="stat-value">{stats['avg_response_time']:.1f}s</div>
-        <div class="stat-label">Avg Response Time</div>
-    </div>
-    """, unsafe_allow_html=True)
-
-    st.markdown(f"""
-    <div class="stat-card">
-        <div class="stat-value">{stats['laws_indexed']}</div>
-        <div class="stat-label">Laws Indexed</div>
-    </div>
-    """, unsafe_allow_html=True)
+    # One markdown element for all cards instead of one per card
+    st.markdown("".join(
+        STAT_CARD_TMPL.format(value=value, label=label)
+        for value, label in (
+            (stats['queries_today'], "Queries Today"),
+            (f"{stats['avg_response_time']:.1f}s", "Avg Response Time"),
+            (stats['laws_indexed'], "Laws Indexed"),
+        )
+    ), unsafe_allow_html=True)
 
     if SECURITY_ENABLED:
         st.markdown('<div class="security-badge">🛡️ Security Active</div>', unsafe_allow_html=True)
@@ -973,7 +987,24 @@ st.markdown(
 )
 
 # -------------------- CHAT WINDOW --------------------
+USER_MESSAGE_TMPL = (
+    '<div class="message-row user"><div class="user-message">'
+    '<strong>You</strong><br/>{content}'
+    '</div></div>'
+)
+AI_MESSAGE_TMPL = (
+    '<div class="message-row ai"><div class="ai-message">'
+    '<strong>🤖 DriveSmart AI</strong><br/>{content}'
+    '<div class="message-meta">'
+    '<span>⏱️ {response_time:.2f}s</span>'
+    '<span>📚 {sources} sources</span>'
+    '<span>📍 {jurisdiction}</span>'
+    '</div></div></div>'
+)
+
 def render_chat(messages):
+    # Collect the rows and emit the whole history as one markdown element
+    parts = []
     for message in messages:
         role = message.get("role")
         raw_content = message.get("content", "")
@@ -983,38 +1014,17 @@ def render_chat(messages):
         content = html.escape(clean).replace("\n", "<br/>")
 
         if role == "user":
-            st.markdown(
-                f"""
-                <div class="message-row user">
-                    <div class="user-message">
-                        <strong>You</strong><br/>
-                        {content}
-                    </div>
-                </div>
-                """,
-                unsafe_allow_html=True
-            )
+            parts.append(USER_MESSAGE_TMPL.format(content=content))
         else:
-            sources = metadata.get("sources_count", 0)
-            response_time = metadata.get("response_time", 0.0)
-            jurisdiction = metadata.get("jurisdiction", "All")
-
-            st.markdown(
-                f"""
-                <div class="message-row ai">
-                    <div class="ai-message">
-                        <strong>🤖 DriveSmart AI</strong><br/>
-                        {content}
-                        <div class="message-meta">
-                            <span>⏱️ {response_time:.2f}s</span>
-                            <span>📚 {sources} sources</span>
-                            <span>📍 {jurisdiction}</span>
-                        </div>
-                    </div>
-                </div>
-                """,
-                unsafe_allow_html=True
-            )
+            parts.append(AI_MESSAGE_TMPL.format(
+                content=content,
+                response_time=metadata.get("response_time", 0.0),
+                sources=metadata.get("sources_count", 0),
+                jurisdiction=metadata.get("jurisdiction", "All")
+            ))
+
+    if parts:
+        st.markdown("".join(parts), unsafe_allow_html=True)
 render_chat(st.session_state.messages)
 
 # ✅ Intro image only until the first user question
@@ -1112,6 +1122,8 @@ if st.session_state.processing and st.session_state.pending_query:
     # Phase 3: compute and replace the thinking bubble
     start_time = time.time()
 
+    in_scope = is_traffic_related(pending)
+
     # ---------------- SECURITY VALIDATION ----------------
     if SECURITY_ENABLED and input_validator and behavioral_monitor:
         validation = input_validator.validate_input(pending)
@@ -1162,8 +1174,14 @@ if st.session_state.processing and st.session_state.pending_query:
             st.session_state.thinking_rendered = False
             st.rerun()
 
+    # Start retrieval (embedding + Chroma round trip) only after the security gate, so
+    # unsafe input and rate-limited or blocked sessions never cost an embedding call
+    prefetch = None
+    if in_scope and hasattr(workflow, "retrieve"):
+        prefetch = get_prefetch_pool().submit(workflow.retrieve, pending)
+
     # ---------------- SCOPE GUARD ----------------
-    if not is_traffic_related(pending):
+    if not in_scope:
         oos_text = build_out_of_scope_answer(supported_states)
 
         if st.session_state.messages and st.session_state.messages[-1].get("metadata", {}).get("is_thinking"):
@@ -1209,7 +1227,10 @@ if st.session_state.processing and st.session_state.pending_query:
         prompt_type_key = "general"
 
     # ---------------- RUN WORKFLOW ----------------
-    result = workflow.query(pending, prompt_type_key)
+    if prefetch is not None:
+        result = workflow.query(pending, prompt_type_key, docs=prefetch.result())
+    else:
+        result = workflow.query(pending, prompt_type_key)
     response_time = time.time() - start_time
 
     jur = result.get("detected_jurisdiction", "All")
@@ -1,34 +1,111 @@
 # db_connection.py
 import os
 import sqlite3
+import threading
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Optional
 import chromadb
-from chromadb.config import Settings
 from dotenv import load_dotenv
-import pandas as pd
-from datetime import datetime
 
-# Load environment variables
-load_dotenv()
+_ENV_KEYS = ("CHROMA_API_KEY", "CHROMA_TENANT", "CHROMA_DB", "OPENAI_API_KEY")
+
+# Load environment variables (skipped when they are all already exported)
+if not all(os.getenv(k) for k in _ENV_KEYS):
+    load_dotenv()
+
+@dataclass(frozen=True, slots=True)
+class ChromaCfg:
+    """Chroma Cloud / OpenAI settings, read from the environment once"""
+    api_key: Optional[str]
+    tenant: Optional[str]
+    db: Optional[str]
+    openai_key: Optional[str]
+
+_CFG = ChromaCfg(*(os.getenv(k) for k in _ENV_KEYS))
+
+@lru_cache(maxsize=1)
+def get_chroma_client():
+    """Process-wide Chroma Cloud client, so every DatabaseManager shares one connection pool"""
+    return chromadb.HttpClient(
+        host="api.trychroma.com",
+        port=443,
+        ssl=True,
+        headers={
+            "Authorization": f"Bearer {_CFG.api_key}",
+            "X-Chroma-Token": _CFG.api_key
+        },
+        tenant=_CFG.tenant,
+        database=_CFG.db
+    )
+
+@lru_cache(maxsize=1)
+def get_embedding_function():
+    """Process-wide OpenAI embedding function for the traffic_laws collection"""
+    from chromadb.utils import embedding_functions
+    return embedding_functions.OpenAIEmbeddingFunction(
+        api_key=_CFG.openai_key,
+        model_name="text-embedding-3-small"
+    )
+
+# UI labels / abbreviations -> canonical `jurisdiction` metadata values (None = no filter)
+_JURISDICTION_ALIASES = {
+    "all": None,
+    "ma": "Massachusetts",
+    "ca": "California",
+    "ny": "New York",
+    "tx": "Texas",
+    "fl": "Florida",
+}
+
+def _jurisdiction_where(jurisdiction):
+    """Chroma `where` predicate for a jurisdiction label, so filtering happens server-side"""
+    if not jurisdiction:
+        return None
+    label = jurisdiction.strip()
+    norm = label.lower()
+    canonical = _JURISDICTION_ALIASES.get(norm, label)
+    if not canonical:
+        return None
+    # jurisdiction_norm (set at ingest) matches any casing; the exact field covers
+    # collections indexed before it existed
+    return {"$or": [{"jurisdiction_norm": canonical.lower()}, {"jurisdiction": canonical}]}
+
+INSERT_QUERY_SQL = '''
+    INSERT INTO query_history 
+    (query, response, jurisdiction, analysis_type, response_time, sources_count, chroma_ids)
+    VALUES (?, ?, ?, ?, ?, ?, ?)
+'''
+
+def _query_row(query_data):
+    return (
+        query_data['query'],
+        query_data['response'],
+        query_data['jurisdiction'],
+        query_data['analysis_type'],
+        query_data['response_time'],
+        query_data.get('sources_count', 0),
+        ','.join(query_data.get('chroma_ids', []))
+    )
 
 class DatabaseManager:
     def __init__(self):
         # Initialize ChromaDB connection
-        self.chroma_client = chromadb.HttpClient(
-            host="https://api.trychroma.com",
-            port=443,
-            ssl=True,
-            headers={
-                "Authorization": f"Bearer {os.getenv('CHROMA_API_KEY')}"
-            },
-            tenant=os.getenv('CHROMA_TENANT'),
-            database=os.getenv('CHROMA_DB')
-        )
+        self.chroma_client = get_chroma_client()
         
         # Get the traffic_laws collection
         self.traffic_collection = self.chroma_client.get_collection("traffic_laws")
         
         # Initialize SQLite for query history
+        # One connection shared by every thread (Streamlit runs each rerun on a new one),
+        # so it is opened and configured once; all use is serialized by _lock
+        self._lock = threading.Lock()
         self.sqlite_conn = sqlite3.connect('drivesmart_analytics.db', check_same_thread=False)
+        self.sqlite_conn.row_factory = sqlite3.Row
+        # WAL + NORMAL sync: commits append to the log without an fsync each time
+        self.sqlite_conn.execute("PRAGMA journal_mode=WAL")
+        self.sqlite_conn.execute("PRAGMA synchronous=NORMAL")
+        self.sqlite_conn.execute("PRAGMA temp_store=MEMORY")
         self._init_sqlite_tables()
     
     def _init_sqlite_tables(self):
@@ -60,68 +137,53 @@ class DatabaseManager:
             )
         ''')
         
+        # Indexes for get_stats: "today" range scan and distinct jurisdictions
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_qh_ts ON query_history(timestamp)')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_qh_jur ON query_history(jurisdiction)')
+        
         self.sqlite_conn.commit()
     
     def search_traffic_laws(self, query, jurisdiction=None, n_results=5):
         """Search traffic laws in ChromaDB"""
-        where_clause = None
-        if jurisdiction:
-            where_clause = {"jurisdiction": jurisdiction}
-        
         results = self.traffic_collection.query(
             query_texts=[query],
             n_results=n_results,
-            where=where_clause
+            where=_jurisdiction_where(jurisdiction)
         )
         
         return results
     
     def save_query(self, query_data):
         """Save query to SQLite"""
-        cursor = self.sqlite_conn.cursor()
-        
-        cursor.execute('''
-            INSERT INTO query_history 
-            (query, response, jurisdiction, analysis_type, response_time, sources_count, chroma_ids)
-            VALUES (?, ?, ?, ?, ?, ?, ?)
-        ''', (
-            query_data['query'],
-            query_data['response'],
-            query_data['jurisdiction'],
-            query_data['analysis_type'],
-            query_data['response_time'],
-            query_data.get('sources_count', 0),
-            ','.join(query_data.get('chroma_ids', []))
-        ))
-        
-        self.sqlite_conn.commit()
+        with self._lock, self.sqlite_conn as conn:
+            cursor = conn.execute(INSERT_QUERY_SQL, _query_row(query_data))
         return cursor.lastrowid
     
+    def save_queries(self, queries):
+        """Save a batch of queries in a single transaction"""
+        rows = [_query_row(q) for q in queries]
+        with self._lock, self.sqlite_conn as conn:
+            cursor = conn.executemany(INSERT_QUERY_SQL, rows)
+        return cursor.rowcount
+    
     def get_stats(self):
         """Get dashboard statistics"""
-        cursor = self.sqlite_conn.cursor()
-        
-        # Today's stats
-        today_stats = cursor.execute('''
-            SELECT 
-                COUNT(*) as queries_today,
-                AVG(response_time) as avg_response_time
-            FROM query_history
-            WHERE DATE(timestamp) = DATE('now')
-        ''').fetchone()
-        
-        # Total stats
-        total_stats = cursor.execute('''
-            SELECT 
-                COUNT(*) as total_queries,
-                COUNT(DISTINCT jurisdiction) as jurisdictions_used
-            FROM query_history
-        ''').fetchone()
+        # Today's and total stats in one round trip (aggregates always return one row)
+        with self._lock:
+            row = self.sqlite_conn.execute('''
+                SELECT 
+                    COUNT(*) as queries_today,
+                    AVG(response_time) as avg_response_time,
+                    (SELECT COUNT(*) FROM query_history) as total_queries,
+                    (SELECT COUNT(DISTINCT jurisdiction) FROM query_history) as jurisdictions_used
+                FROM query_history
+                WHERE timestamp >= DATE('now') AND timestamp < DATE('now', '+1 day')
+            ''').fetchone()
         
         return {
-            'queries_today': today_stats[0] if today_stats else 0,
-            'avg_response_time': today_stats[1] if today_stats and today_stats[1] else 0,
-            'total_queries': total_stats[0] if total_stats else 0,
-            'jurisdictions_used': total_stats[1] if total_stats else 0,
+            'queries_today': row['queries_today'],
+            'avg_response_time': row['avg_response_time'] or 0,
+            'total_queries': row['total_queries'],
+            'jurisdictions_used': row['jurisdictions_used'],
             'laws_indexed': self.traffic_collection.count()  # Get from ChromaDB
         }
\ No newline at end of file
@@ -0,0 +1,31 @@
+# probe_all.py
+"""
+Run every Chroma Cloud probe in one process: Python starts and chromadb is
+imported once, and the chromadb probes share one client (chroma_client.py).
+The individual test_*.py scripts still run on their own.
+Besides the Chroma credentials, the query probes need OPENAI_API_KEY to embed
+the probe query the first time (query_cache.embed).
+"""
+import asyncio
+import test_chromadb
+import test_collection
+import test_db
+import test_simple
+
+
+async def main():
+    # The probes are independent network round trips, so run them concurrently
+    results = await asyncio.gather(
+        test_chromadb.main(),
+        test_collection.main(),
+        test_db.main(),
+        test_simple.main(),
+        return_exceptions=True
+    )
+    for name, result in zip(("test_chromadb", "test_collection", "test_db", "test_simple"), results):
+        if isinstance(result, Exception):
+            print(f"❌ {name} failed: {result}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
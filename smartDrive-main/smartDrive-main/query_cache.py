@@ -0,0 +1,169 @@
+# query_cache.py
+import asyncio
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+# Probe query results, persisted between runs so repeat probes skip the network query
+CACHE = Path(".chroma_query_cache.json")
+_mem = None
+
+# Query embeddings, cached without expiry: the same text and model always embed the same,
+# so the server never has to embed a probe query again
+EMBED_CACHE = Path(".chroma_query_embeddings.json")
+EMBED_MODEL = "text-embedding-3-small"  # must match the collection (db_connection.get_embedding_function)
+_vecs = None
+
+# probe_all.py runs sync probes in worker threads next to the event loop; one lock
+# guards both caches from load through mutate and write
+_lock = threading.Lock()
+# Cache keys whose value is being computed, each with an Event set when it is done, so
+# concurrent probes wait for one embedding / query call instead of all making it
+_inflight = {}
+
+
+def _load():
+    global _mem
+    if _mem is None:
+        try:
+            _mem = json.loads(CACHE.read_text())
+        except (FileNotFoundError, ValueError):
+            _mem = {}
+    return _mem
+
+
+def _key(collection, texts, n_results):
+    raw = "|".join([collection.name, *texts, str(n_results)])
+    return hashlib.blake2b(raw.encode(), digest_size=16).hexdigest()
+
+
+def _get(key, ttl):
+    # Caller holds _lock
+    entry = _load().get(key)
+    if entry and time.time() - entry["ts"] < ttl:
+        return entry["result"]
+    return None
+
+
+def _claim(key, ttl):
+    """
+    (result, event, owner) for key: a fresh cached result, or the in-flight Event to
+    wait on before checking again, or a new Event that the caller owns and must pass
+    to _release once it has computed (or failed to compute) the result
+    """
+    with _lock:
+        result = _get(key, ttl)
+        if result is not None:
+            return result, None, False
+        event = _inflight.get(key)
+        if event is not None:
+            return None, event, False
+        event = _inflight[key] = threading.Event()
+        return None, event, True
+
+
+def _release(keys, event):
+    with _lock:
+        for key in keys:
+            del _inflight[key]
+    event.set()
+
+
+def _to_json(obj):
+    # numpy arrays (e.g. embeddings) -> lists
+    return obj.tolist() if hasattr(obj, "tolist") else str(obj)
+
+
+def _write(path, data):
+    # Write to a uniquely named temp file and rename, so an interrupted run never leaves
+    # a torn cache (callers hold _lock)
+    with tempfile.NamedTemporaryFile("w", dir=path.parent, prefix=path.name, suffix=".tmp", delete=False) as tmp:
+        tmp.write(json.dumps(data, default=_to_json))
+    os.replace(tmp.name, path)
+
+
+def _put(key, result):
+    with _lock:
+        mem = _load()
+        mem[key] = {"ts": time.time(), "result": result}
+        _write(CACHE, mem)
+
+
+def embed(texts):
+    """
+    Embeddings for texts with EMBED_MODEL, computed locally once and then read from disk.
+    Computing one needs OPENAI_API_KEY (db_connection.get_embedding_function).
+    """
+    global _vecs
+    while True:
+        with _lock:
+            if _vecs is None:
+                try:
+                    _vecs = json.loads(EMBED_CACHE.read_text())
+                except (FileNotFoundError, ValueError):
+                    _vecs = {}
+            missing = [f"{EMBED_MODEL}|{t}" for t in dict.fromkeys(texts) if f"{EMBED_MODEL}|{t}" not in _vecs]
+            if not missing:
+                return [_vecs[f"{EMBED_MODEL}|{t}"] for t in texts]
+            # Embed what nobody else is embedding; wait for the rest
+            waiting = {_inflight[k] for k in missing if k in _inflight}
+            mine = [k for k in missing if k not in _inflight]
+            event = threading.Event()
+            for k in mine:
+                _inflight[k] = event
+        
+        if mine:
+            try:
+                # The embedding call is a network round trip, so it runs outside the lock
+                from db_connection import get_embedding_function
+                vecs = get_embedding_function()([k.split("|", 1)[1] for k in mine])
+                with _lock:
+                    _vecs.update(zip(mine, vecs))
+                    _write(EMBED_CACHE, _vecs)
+            finally:
+                _release(mine, event)
+        for other in waiting:
+            other.wait()
+        # Check again: anything a failed call left missing is embedded on the next pass
+
+
+def cached_query(collection, texts, n_results, ttl=3600):
+    """collection.query for texts (embedded locally via embed), cached for ttl seconds"""
+    key = _key(collection, texts, n_results)
+    while True:
+        result, event, owner = _claim(key, ttl)
+        if result is not None:
+            return result
+        if not owner:
+            event.wait()
+            continue
+        try:
+            result = dict(collection.query(query_embeddings=embed(texts), n_results=n_results))
+            _put(key, result)
+            return result
+        finally:
+            _release([key], event)
+
+
+async def acached_query(collection, texts, n_results, ttl=3600):
+    """cached_query for async collections"""
+    key = _key(collection, texts, n_results)
+    while True:
+        result, event, owner = _claim(key, ttl)
+        if result is not None:
+            return result
+        if not owner:
+            # The owner may be a worker thread, so wait without blocking the event loop
+            await asyncio.to_thread(event.wait)
+            continue
+        try:
+            vecs = await asyncio.to_thread(embed, texts)
+            result = dict(await collection.query(query_embeddings=vecs, n_results=n_results))
+            _put(key, result)
+            return result
+        finally:
+            _release([key], event)
@@ -1,75 +1,124 @@
-import os
-import chromadb
-from dotenv import load_dotenv
+import argparse
+import asyncio
+import threading
+from chroma_client import get_client
+from config import creds
+# The probe query is embedded locally on a cache miss, so OPENAI_API_KEY is needed
+# alongside the Chroma credentials (see query_cache.embed)
+from query_cache import cached_query
 
-load_dotenv()
+api_key, tenant, database = creds()
 
-api_key = os.getenv('CHROMA_API_KEY')
-tenant = os.getenv('CHROMA_TENANT')
-database = os.getenv('CHROMA_DB')
 
-print("Testing ChromaDB with correct client...")
-print("-" * 50)
-
-try:
-    # Use the ChromaDB client directly without specifying v1 endpoints
-    from chromadb import HttpClient
+def in_daemon_thread(fn, **kwargs):
+    """
+    Run fn(**kwargs) in a daemon thread and return a future for its result.
+    Unlike asyncio.to_thread, an abandoned call does not hold up asyncio.run's
+    executor shutdown or interpreter exit; it is simply left to die with the process.
+    """
+    loop = asyncio.get_running_loop()
+    future = loop.create_future()
     
-    client = HttpClient(
-        host="api.trychroma.com",
-        port=443,
-        ssl=True,
-        headers={
-            "Authorization": f"Bearer {api_key}",
-            "X-Chroma-Token": api_key  # Try both header formats
-        },
-        tenant=tenant,
-        database=database
-    )
+    def settle(result, error):
+        if not future.done():
+            if error is not None:
+                future.set_exception(error)
+            else:
+                future.set_result(result)
     
+    def run():
+        result, error = None, None
+        try:
+            result = fn(**kwargs)
+        except Exception as e:
+            error = e
+        try:
+            loop.call_soon_threadsafe(settle, result, error)
+        except RuntimeError:
+            pass  # the event loop has already closed
+    
+    threading.Thread(target=run, daemon=True).start()
+    return future
+
+
+async def http_probe(client, with_count):
     print("✅ Client created")
     
-    # List collections
-    collections = client.list_collections()
+    # List collections and get traffic_laws concurrently (independent calls)
+    collections, collection = await asyncio.gather(
+        client.list_collections(),
+        client.get_collection("traffic_laws")
+    )
     print(f"✅ Found {len(collections)} collections")
     
     for col in collections:
         print(f"  - {col.name}")
     
-    # Try to get traffic_laws collection
+    # get_collection already proves access; count() is an extra round trip
+    msg = "✅ Got traffic_laws collection"
+    if with_count:
+        msg += f" with {await collection.count()} records"
+    print(msg)
+
+
+async def cloud_probe(client, with_count):
+    print("✅ CloudClient connected")
+    
+    # Get collection, then test a query (and count, if asked) concurrently
+    # (the sync client's calls run in worker threads)
     collection = client.get_collection("traffic_laws")
-    print(f"✅ Got traffic_laws collection with {collection.count()} records")
+    if with_count:
+        count, results = await asyncio.gather(
+            asyncio.to_thread(collection.count),
+            asyncio.to_thread(cached_query, collection, ["speed limit"], 1)
+        )
+        print(f"✅ Got collection with {count} records")
+    else:
+        results = await asyncio.to_thread(cached_query, collection, ["speed limit"], 1)
+        print("✅ Got collection")
     
-except Exception as e:
-    print(f"❌ Error: {e}")
+    if results['documents'][0]:
+        print("✅ Query successful!")
+        print(f"Sample result: {results['documents'][0][0][:100]}...")
+
+
+async def main(with_count=False):
+    print("Testing ChromaDB with correct client...")
+    print("-" * 50)
     
-    print("\n" + "="*50)
-    print("Let's try the CloudClient instead...")
+    from chromadb import CloudClient
     
+    # Connect with the shared AsyncHttpClient and CloudClient at the same time, so a
+    # failing HttpClient no longer delays the CloudClient fallback by a full round trip.
+    # Whichever connects first runs its probe; if connecting or the probe fails,
+    # the other client is tried next.
+    tasks = {
+        asyncio.create_task(get_client()): ("AsyncHttpClient", http_probe),
+        # CloudClient is synchronous and a thread cannot be cancelled, so it connects in
+        # a daemon thread: once a probe succeeds, a still-running connect is abandoned
+        # instead of keeping the script alive until it finishes
+        in_daemon_thread(
+            CloudClient, tenant=tenant, database=database, api_key=api_key
+        ): ("CloudClient", cloud_probe),
+    }
+    pending = set(tasks)
     try:
-        from chromadb import CloudClient
-        
-        client = CloudClient(
-            tenant=tenant,
-            database=database,
-            api_key=api_key
-        )
-        
-        print("✅ CloudClient connected")
-        
-        # Get collection
-        collection = client.get_collection("traffic_laws")
-        print(f"✅ Got collection with {collection.count()} records")
-        
-        # Test a query
-        results = collection.query(
-            query_texts=["speed limit"],
-            n_results=1
-        )
-        
-        if results['documents'][0]:
-            print("✅ Query successful!")
-            print(f"Sample result: {results['documents'][0][0][:100]}...")
-            
-    except Exception as e2:
-        print(f"❌ CloudClient also failed: {e2}")
\ No newline at end of file
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                name, probe = tasks[task]
+                try:
+                    await probe(task.result(), with_count)
+                    return
+                except Exception as e:
+                    print(f"❌ {name} failed: {e}")
+    finally:
+        for task in pending:
+            task.cancel()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--with-count", action="store_true", help="also report the collection's record count")
+    args = parser.parse_args()
+    asyncio.run(main(with_count=args.with_count))
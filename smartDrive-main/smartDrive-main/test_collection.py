@@ -1,28 +1,26 @@
 # test_collection.py
-import chromadb
-from chromadb import HttpClient
-import os
-from dotenv import load_dotenv
+import asyncio
+import sys
+from chroma_client import get_client
 
-load_dotenv()
 
-client = HttpClient(
-    host="api.trychroma.com",
-    port=443,
-    ssl=True,
-    headers={
-        "Authorization": f"Bearer {os.getenv('CHROMA_API_KEY')}",
-        "X-Chroma-Token": os.getenv('CHROMA_API_KEY')
-    },
-    tenant=os.getenv('CHROMA_TENANT'),
-    database=os.getenv('CHROMA_DB')
-)
+async def main():
+    client = await get_client()
 
-collection = client.get_collection("traffic_laws")
+    collection = await client.get_collection("traffic_laws")
 
-# Get a few documents without using embeddings
-peek = collection.peek(5)  # Get first 5 documents
-print("Sample documents in collection:")
-for i, (doc, meta) in enumerate(zip(peek['documents'], peek['metadatas'])):
-    print(f"\n{i+1}. {meta}")
-    print(f"   Document: {doc[:200]}...")
\ No newline at end of file
+    # Get the first 5 documents without their embeddings (peek() would include them)
+    peek = await collection.get(limit=5, include=["documents", "metadatas"])
+    # Keep only the 200-char previews and drop the full documents right away
+    preview = [(meta, doc[:200]) for doc, meta in zip(peek['documents'], peek['metadatas'])]
+    del peek
+    # One write for the whole block, so it stays contiguous alongside other probes
+    lines = [
+        f"\n{i+1}. {meta}\n   Document: {trunc}..."
+        for i, (meta, trunc) in enumerate(preview)
+    ]
+    sys.stdout.write("\n".join(["Sample documents in collection:", *lines]) + "\n")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
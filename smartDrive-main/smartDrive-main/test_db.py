@@ -1,61 +1,66 @@
-import os
-import chromadb
-from dotenv import load_dotenv
+import argparse
+import asyncio
+import sys
+from chroma_client import get_client
+from config import creds
+# The probe query is embedded locally on a cache miss, so OPENAI_API_KEY is needed
+# alongside the Chroma credentials (see query_cache.embed)
+from query_cache import acached_query
 
-# Load environment variables
-load_dotenv()
+api_key, tenant, db_name = creds()
 
-print("Testing ChromaDB Connection...")
-print("-" * 50)
-
-# Print environment variables (hide sensitive parts)
-api_key = os.getenv('CHROMA_API_KEY')
-tenant = os.getenv('CHROMA_TENANT')
-db_name = os.getenv('CHROMA_DB')
-
-print(f"API Key: {api_key[:10]}..." if api_key else "API Key: NOT FOUND")
-print(f"Tenant: {tenant}")
-print(f"Database: {db_name}")
-print("-" * 50)
-
-try:
-    # Connect to ChromaDB
-    client = chromadb.HttpClient(
-        host="https://api.trychroma.com",
-        port=443,
-        ssl=True,
-        headers={
-            "Authorization": f"Bearer {api_key}"
-        },
-        tenant=tenant,
-        database=db_name
-    )
-    
-    print("✅ Connected to ChromaDB successfully!")
-    
-    # Get the traffic_laws collection
-    collection = client.get_collection("traffic_laws")
-    print(f"✅ Found 'traffic_laws' collection")
+async def main(with_count=False):
+    # Output is collected and written in one block, so it stays contiguous
+    # when probes run concurrently (probe_all.py)
+    lines = [
+        "Testing ChromaDB Connection...",
+        "-" * 50,
+        # Print environment variables (hide sensitive parts)
+        f"API Key: {api_key[:10]}..." if api_key else "API Key: NOT FOUND",
+        f"Tenant: {tenant}",
+        f"Database: {db_name}",
+        "-" * 50,
+    ]
     
-    # Count documents
-    count = collection.count()
-    print(f"✅ Collection has {count} documents")
+    try:
+        # Connect to ChromaDB (shared client, see chroma_client.py)
+        client = await get_client()
+        
+        lines.append("✅ Connected to ChromaDB successfully!")
+        
+        # Get the traffic_laws collection
+        collection = await client.get_collection("traffic_laws")
+        lines.append("✅ Found 'traffic_laws' collection")
+        
+        # Test a search, and count documents concurrently if asked (both only need the collection)
+        lines.append("\nTesting search for 'speed limit'...")
+        if with_count:
+            count, results = await asyncio.gather(
+                collection.count(),
+                acached_query(collection, ["speed limit"], 2)
+            )
+            lines.append(f"✅ Collection has {count} documents")
+        else:
+            results = await acached_query(collection, ["speed limit"], 2)
+        
+        if results['documents'][0]:
+            lines.append(f"✅ Found {len(results['documents'][0])} results")
+            lines.append("\nFirst result preview:")
+            lines.append(results['documents'][0][0][:200] + "...")
+        
+    except Exception as e:
+        lines.append(f"❌ Error: {e}")
+        lines.append("\nTroubleshooting:")
+        lines.append("1. Check your .env file has correct credentials")
+        lines.append("2. Ensure you have internet connection")
+        lines.append("3. Verify ChromaDB API key is valid")
     
-    # Test a search
-    print("\nTesting search for 'speed limit'...")
-    results = collection.query(
-        query_texts=["speed limit"],
-        n_results=2
-    )
-    
-    if results['documents'][0]:
-        print(f"✅ Found {len(results['documents'][0])} results")
-        print("\nFirst result preview:")
-        print(results['documents'][0][0][:200] + "...")
-    
-except Exception as e:
-    print(f"❌ Error: {e}")
-    print("\nTroubleshooting:")
-    print("1. Check your .env file has correct credentials")
-    print("2. Ensure you have internet connection")
-    print("3. Verify ChromaDB API key is valid")
\ No newline at end of file
+    finally:
+        sys.stdout.write("\n".join(lines) + "\n")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--with-count", action="store_true", help="also report the collection's document count")
+    args = parser.parse_args()
+    asyncio.run(main(with_count=args.with_count))
@@ -1,38 +1,56 @@
-import requests
-import os
-from dotenv import load_dotenv
+import asyncio
+import httpx
+from config import creds
 
-load_dotenv()
+api_key, tenant, database = creds()
 
-api_key = os.getenv('CHROMA_API_KEY')
-tenant = os.getenv('CHROMA_TENANT')
-database = os.getenv('CHROMA_DB')
-
-print(f"Using API Key: {api_key[:10]}...")
-print(f"Tenant: {tenant}")
-print(f"Database: {database}")
-print("-" * 50)
-
-# Test the API directly
-url = f"https://api.trychroma.com/api/v1/tenants/{tenant}/databases/{database}/collections"
-headers = {
+# Test the API directly; URL and headers are resolved once at import
+BASE_URL = f"https://api.trychroma.com/api/v1/tenants/{tenant}/databases/{database}"
+HEADERS = {
     "Authorization": f"Bearer {api_key}",
     "Content-Type": "application/json"
 }
 
-print("Testing direct API call...")
-response = requests.get(url, headers=headers)
-print(f"Status Code: {response.status_code}")
-
-if response.status_code == 200:
-    print("✅ API connection successful!")
-    data = response.json()
-    print(f"Found {len(data)} collections")
-elif response.status_code == 401:
-    print("❌ Authentication failed - API key not recognized")
-elif response.status_code == 403:
-    print("❌ Permission denied - API key doesn't have access to this tenant/database")
-elif response.status_code == 404:
-    print("❌ Not found - Check tenant ID and database name")
-else:
-    print(f"Response: {response.text}")
\ No newline at end of file
+# Keep-alive pool sized for the parallel probes; idle connections are kept for a minute
+LIMITS = httpx.Limits(max_keepalive_connections=20, max_connections=20, keepalive_expiry=60.0)
+
+# Independent REST probes, fired in parallel over one pooled client
+PROBE_PATHS = ("/collections", "/collections/traffic_laws", "/collections/traffic_laws/count")
+
+
+async def probe(client, path):
+    response = await client.get(path)
+    return path, response
+
+
+async def main():
+    print(f"Using API Key: {api_key[:10]}...")
+    print(f"Tenant: {tenant}")
+    print(f"Database: {database}")
+    print("-" * 50)
+
+    print("Testing direct API calls...")
+    # retries covers failed connects only (DNS, refused, reset), never HTTP error statuses
+    transport = httpx.AsyncHTTPTransport(retries=2, limits=LIMITS)
+    async with httpx.AsyncClient(base_url=BASE_URL, headers=HEADERS, transport=transport, timeout=10.0) as client:
+        results = await asyncio.gather(*(probe(client, path) for path in PROBE_PATHS))
+
+    for path, response in results:
+        print(f"{path}: Status Code {response.status_code}")
+
+        if response.status_code == 200:
+            print("✅ API connection successful!")
+            if path == "/collections":
+                print(f"Found {len(response.json())} collections")
+        elif response.status_code == 401:
+            print("❌ Authentication failed - API key not recognized")
+        elif response.status_code == 403:
+            print("❌ Permission denied - API key doesn't have access to this tenant/database")
+        elif response.status_code == 404:
+            print("❌ Not found - Check tenant ID and database name")
+        else:
+            print(f"Response: {response.text[:200]}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())